@@ -0,0 +1,44 @@
+"""
+Gunicorn settings; gunicorn reads this file from the working directory.
+
+preload_app (GUNICORN_PRELOAD, on by default) imports Django once in the master
+and warms it up (vaahakainn/warmup.py) before the listening socket is bound, so
+workers fork ready to serve and the first request after a cold start does not
+import or compile anything.
+"""
+
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes', 'on')
+
+
+def on_starting(server):
+    # Runs in the master after the preloaded app is imported, before binding.
+    # Metrics start from zero; exited workers' files are kept until then.
+    from vaahakainn.metrics import clear_directory
+    clear_directory(os.environ.get('METRICS_DIR', ''))
+    if server.cfg.preload_app:
+        from vaahakainn.warmup import warm_up
+        warm_up()
+
+
+def pre_fork(server, worker):
+    # Never hand the master's database/cache connections to a worker.
+    if server.cfg.preload_app:
+        from vaahakainn.warmup import close_connections
+        close_connections()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        from vaahakainn.warmup import warm_up
+        warm_up()
+
+
+def worker_exit(server, worker):
+    # Write the view counters this worker has buffered (stories/view_counts.py)
+    # and its final metrics (vaahakainn/metrics.py).
+    from stories import view_counts
+    from vaahakainn import metrics
+    view_counts.flush()
+    metrics.dump()
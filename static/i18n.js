@@ -16,6 +16,7 @@
             hero_subtitle: 'A magical world of stories and tales, where words meet imagination to create an unforgettable reading experience',
             scroll_explore: 'Scroll to explore',
             featured: 'Featured',
+            trending: 'Trending',
             stories_heading: 'Stories',
             handpicked_subtitle: '',
             episodes: 'Episodes',
@@ -91,6 +92,7 @@
             hero_subtitle: 'ހިޔާލީ ދުނިޔޭގެ ހިތްގައިމުކަން ވާހަކަތަކުން - ހަނދާނުން ނުފޮހެވޭނެ ތަޖުރިބާތަކެއް',
             scroll_explore: 'ސުކްރޯލް ކުރައްވާ',
             featured: 'ފީޗަރ ކުރެވިފައިވާ',
+            trending: 'މަޝްހޫރު',
             stories_heading: 'ވާހަކަތައް',
             handpicked_subtitle: '',
             episodes: 'އެޕިސޯޑް',
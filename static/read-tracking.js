@@ -0,0 +1,39 @@
+// View and read-completion beacons for episode and short story pages.
+// The server counts a page view when it renders the page, except for
+// speculative prefetch/prerender requests: those pages carry data-track-view and
+// report their view here once the reader actually opens them (on load for a
+// prefetched page, on activation for a prerendered one). A read is reported
+// once the end marker (placed after the text) scrolls into view.
+
+(function() {
+    const marker = document.querySelector('[data-track-url]');
+    if (!marker || !navigator.sendBeacon) {
+        return;
+    }
+
+    function send(event) {
+        const data = new FormData();
+        data.append('content_type', marker.dataset.trackType);
+        data.append('object_id', marker.dataset.trackId);
+        data.append('event', event);
+        navigator.sendBeacon(marker.dataset.trackUrl, data);
+    }
+
+    if ('trackView' in marker.dataset) {
+        if (document.prerendering) {
+            document.addEventListener('prerenderingchange', () => send('views'), { once: true });
+        } else {
+            send('views');
+        }
+    }
+
+    if ('IntersectionObserver' in window) {
+        const observer = new IntersectionObserver((entries) => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                observer.disconnect();
+                send('reads');
+            }
+        });
+        observer.observe(marker);
+    }
+})();
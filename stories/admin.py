@@ -1,22 +1,183 @@
-from django.contrib import admin
+from datetime import datetime
+
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.contenttypes.admin import GenericTabularInline
+from django.contrib.contenttypes.forms import BaseGenericInlineFormSet
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Author, Genre, Episode, Story, Category, Comment, Reaction, ShortStory
+from django.utils.http import urlencode
+from .models import Author, Genre, Episode, Story, Category, Comment, DailyViews, Reaction, ReactionRollup, ShortStory
+from .reaction_rollups import delete_reactions_for
+
+
+def _count_for(model, source, **filters):
+	"""Correlated subquery counting `source` rows (Comment/Reaction) attached to each row of `model`."""
+	ct = ContentType.objects.get_for_model(model)
+	counts = (
+		source.objects.filter(content_type=ct, object_id=OuterRef('pk'), **filters)
+		.order_by()
+		.values('object_id')
+		.annotate(n=Count('pk'))
+		.values('n')
+	)
+	return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def _reaction_count_for(model, **filters):
+	"""_count_for(model, Reaction) plus the reactions already compacted into daily rollups."""
+	ct = ContentType.objects.get_for_model(model)
+	rolled_up = (
+		ReactionRollup.objects.filter(content_type=ct, object_id=OuterRef('pk'), **filters)
+		.order_by()
+		.values('object_id')
+		.annotate(n=Sum('count'))
+		.values('n')
+	)
+	return _count_for(model, Reaction, **filters) + Coalesce(Subquery(rolled_up, output_field=IntegerField()), 0)
+
+
+def _views_for(model, field):
+	"""Correlated subquery summing DailyViews.<field> (views/reads) for each row of `model`."""
+	ct = ContentType.objects.get_for_model(model)
+	totals = (
+		DailyViews.objects.filter(content_type=ct, object_id=OuterRef('pk'))
+		.order_by()
+		.values('object_id')
+		.annotate(n=Sum(field))
+		.values('n')
+	)
+	return Coalesce(Subquery(totals, output_field=IntegerField()), 0)
+
+
+def _content_object_prefetch():
+	"""Bulk-load GenericForeignKey targets, one query per content type, with what their __str__ needs."""
+	return GenericPrefetch('content_object', [
+		Story.objects.all(),
+		Episode.objects.for_listing(),
+		ShortStory.objects.for_listing().select_related('author'),
+		Comment.objects.select_related('content_type').prefetch_related(
+			GenericPrefetch('content_object', [
+				Story.objects.all(),
+				Episode.objects.for_listing(),
+				ShortStory.objects.for_listing().select_related('author'),
+			])
+		),
+	])
+
+
+class EngagementCountsMixin:
+	"""Annotates approved-comment and heart counts so changelists don't run two COUNTs per row."""
+
+	def get_queryset(self, request):
+		return super().get_queryset(request).annotate(
+			_total_comments=_count_for(self.model, Comment, is_approved=True),
+			_heart_reactions=_reaction_count_for(self.model, reaction_type='heart'),
+			_total_views=_views_for(self.model, 'views'),
+			_total_reads=_views_for(self.model, 'reads'),
+		)
+
+	def total_comments(self, obj):
+		return obj._total_comments
+	total_comments.short_description = 'Comments'
+	total_comments.admin_order_field = '_total_comments'
+
+	def heart_reactions(self, obj):
+		return obj._heart_reactions
+	heart_reactions.short_description = '❤️ Hearts'
+	heart_reactions.admin_order_field = '_heart_reactions'
+
+	def total_views(self, obj):
+		return obj._total_views
+	total_views.short_description = '👁 Views'
+	total_views.admin_order_field = '_total_views'
+
+	def total_reads(self, obj):
+		return obj._total_reads
+	total_reads.short_description = 'Read to the end'
+	total_reads.admin_order_field = '_total_reads'
+
+	def engagement_links(self, obj):
+		if obj is None or obj.pk is None:
+			return '-'
+		ct = ContentType.objects.get_for_model(obj)
+		comments_url = reverse('admin:stories_comment_moderation') + '?' + urlencode({'ct': ct.pk, 'object_id': obj.pk})
+		reactions_url = reverse('admin:stories_reaction_changelist') + '?' + urlencode({'content_type__id__exact': ct.pk, 'object_id': obj.pk})
+		return format_html(
+			'<a href="{}">All {} comments</a> &middot; <a href="{}">All {} hearts / reactions</a>',
+			comments_url, getattr(obj, '_total_comments', ''), reactions_url, getattr(obj, '_heart_reactions', ''),
+		)
+	engagement_links.short_description = 'Comments & reactions'
+
+
+class ListingChangeList(ChangeList):
+	"""Changelist rows use the model's body-free `for_listing()` projection."""
+
+	def get_queryset(self, request, exclude_parameters=None):
+		return super().get_queryset(request, exclude_parameters).for_listing()
+
+
+class ListingChangeListMixin:
+	def get_changelist(self, request, **kwargs):
+		return ListingChangeList
+
+
+class RecentGenericInlineFormSet(BaseGenericInlineFormSet):
+	"""
+	Shows only the newest `recent_limit` rows. On POST it works on exactly the
+	rows that were rendered (by posted pk), so a comment arriving in between
+	can't shift the window under the editor.
+	"""
+	recent_limit = 20
+
+	def get_queryset(self):
+		if not hasattr(self, '_recent_queryset'):
+			qs = super().get_queryset()
+			if self.is_bound:
+				pk_name = self.model._meta.pk.name
+				posted = (self.data.get(f'{self.add_prefix(i)}-{pk_name}', '') for i in range(self.initial_form_count()))
+				qs = qs.filter(pk__in=[pk for pk in posted if pk.isdigit()])
+			else:
+				qs = qs[:self.recent_limit]
+			self._recent_queryset = qs
+		return self._recent_queryset
 
-# Inline classes for comments and reactions
-class CommentInline(GenericTabularInline):
+
+# Inline classes for comments and reactions. Both are capped to the most recent
+# rows; the parent's "Comments & reactions" field links out to the full lists.
+class RecentGenericInline(GenericTabularInline):
+	formset = RecentGenericInlineFormSet
+	recent_limit = 20
+
+	def get_formset(self, request, obj=None, **kwargs):
+		formset = super().get_formset(request, obj, **kwargs)
+		formset.recent_limit = self.recent_limit
+		return formset
+
+class CommentInline(RecentGenericInline):
 	model = Comment
 	extra = 0
 	fields = ('username', 'comment', 'is_approved', 'is_featured', 'created_at')
 	readonly_fields = ('created_at', 'ip_address')
 	ordering = ['-created_at']
+	verbose_name_plural = 'Latest comments'
 
-class ReactionInline(GenericTabularInline):
+class ReactionInline(RecentGenericInline):
 	model = Reaction
 	extra = 0
 	fields = ('reaction_type', 'username', 'created_at')
 	readonly_fields = ('created_at', 'ip_address', 'user_agent')
 	ordering = ['-created_at']
+	verbose_name_plural = 'Latest reactions'
 
 
 @admin.register(Category)
@@ -34,6 +195,8 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(Author)
 class AuthorAdmin(admin.ModelAdmin):
 	list_display = ('name', 'website')
+	search_fields = ('name',)
+	ordering = ('name',)
 	
 	class Media:
 		css = {
@@ -44,6 +207,8 @@ class AuthorAdmin(admin.ModelAdmin):
 class GenreAdmin(admin.ModelAdmin):
 	list_display = ('name', 'icon')
 	fields = ('name', 'description', 'icon')
+	search_fields = ('name',)
+	ordering = ('name',)
 	
 	class Media:
 		css = {
@@ -56,6 +221,11 @@ class EpisodeInline(admin.TabularInline):
 	fields = ('episode_number', 'title_dv', 'author', 'genre', 'published_date')
 	ordering = ['episode_number']
 	show_change_link = True
+	autocomplete_fields = ('author', 'genre')
+
+	def get_queryset(self, request):
+		# Only the columns the rows display; never pull chapter bodies into the story form.
+		return super().get_queryset(request).only('story', *self.fields)
 
 	class Media:
 		css = {
@@ -64,11 +234,14 @@ class EpisodeInline(admin.TabularInline):
 
 
 @admin.register(Episode)
-class EpisodeAdmin(admin.ModelAdmin):
-	list_display = ('episode_number', 'title_dv', 'story', 'author', 'genre', 'published_date', 'total_comments', 'heart_reactions')
+class EpisodeAdmin(ListingChangeListMixin, EngagementCountsMixin, admin.ModelAdmin):
+	list_display = ('episode_number', 'title_dv', 'story', 'author', 'genre', 'published_date', 'total_views', 'total_reads', 'total_comments', 'heart_reactions')
+	list_select_related = ('story', 'author', 'genre')
+	autocomplete_fields = ('story', 'author', 'genre')
 	list_filter = ('story', 'author', 'genre', 'published_date')
 	search_fields = ('title_dv',)
-	fields = ('story', 'episode_number', 'title_dv', 'content_dv', 'published_date', 'author', 'genre')
+	fields = ('story', 'episode_number', 'title_dv', 'content_dv', 'published_date', 'author', 'genre', 'engagement_links')
+	readonly_fields = ('engagement_links',)
 	inlines = [CommentInline, ReactionInline]
 
 	class Media:
@@ -77,8 +250,9 @@ class EpisodeAdmin(admin.ModelAdmin):
 		}
 
 @admin.register(Story)
-class StoryAdmin(admin.ModelAdmin):
-	list_display = ('display_title', 'category', 'status', 'release_date', 'is_featured', 'total_comments', 'heart_reactions')
+class StoryAdmin(EngagementCountsMixin, admin.ModelAdmin):
+	list_display = ('display_title', 'category', 'status', 'release_date', 'is_featured', 'total_views', 'total_comments', 'heart_reactions')
+	list_select_related = ('category',)
 	list_filter = ('category', 'status', 'release_date', 'is_featured')
 	search_fields = ('title_dv', 'title_en', 'title', 'description_dv', 'description_en', 'description')
 	list_editable = ('is_featured', 'status')
@@ -94,13 +268,16 @@ class StoryAdmin(admin.ModelAdmin):
 		('Story Details', {
 			'fields': ('category', 'status', 'cover_image', 'release_date', 'is_featured'),
 		}),
+		('Engagement', {
+			'fields': ('engagement_links',),
+		}),
 		('Legacy Fields (Auto-populated)', {
 			'fields': ('title', 'description'),
 			'classes': ('collapse',),
 			'description': 'Legacy fields for backward compatibility - do not edit manually'
 		}),
 	)
-	readonly_fields = ('title', 'description')
+	readonly_fields = ('title', 'description', 'engagement_links')
 	inlines = [EpisodeInline, CommentInline, ReactionInline]
 
 	def display_title(self, obj):
@@ -113,12 +290,34 @@ class StoryAdmin(admin.ModelAdmin):
 			'all': ('admin/css/admin_rtl.css',)
 		}
 
+MODERATION_UPDATES = {
+	'approve': {'is_approved': True},
+	'unapprove': {'is_approved': False},
+	'feature': {'is_featured': True, 'is_approved': True},
+	'unfeature': {'is_featured': False},
+}
+
+
+def _parse_cursor(value):
+	"""Parse a moderation-queue cursor of the form '<created_at isoformat>_<id>'."""
+	created_at, _, pk = value.rpartition('_')
+	if not created_at or not pk.isdigit():
+		return None
+	try:
+		return datetime.fromisoformat(created_at), int(pk)
+	except ValueError:
+		return None
+
+
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
 	list_display = ('username', 'content_object', 'comment_preview', 'is_approved', 'is_featured', 'created_at', 'total_reactions')
+	list_select_related = ('content_type',)
 	list_filter = ('is_approved', 'is_featured', 'created_at', 'content_type')
-	search_fields = ('username', 'comment', 'email')
+	search_fields = ('username', 'comment', 'email', '=ip_address')
 	list_editable = ('is_approved', 'is_featured')
+	actions = ['approve_comments', 'unapprove_comments', 'feature_comments']
+	moderation_page_size = 50
 	readonly_fields = ('content_object', 'created_at', 'updated_at', 'ip_address', 'total_reactions', 'heart_reactions')
 	fields = ('content_object', 'username', 'email', 'comment', 'is_approved', 'is_featured', 'ip_address', 'created_at', 'updated_at')
 	
@@ -131,13 +330,130 @@ class CommentAdmin(admin.ModelAdmin):
 		return obj.comment[:50] + '...' if len(obj.comment) > 50 else obj.comment
 	comment_preview.short_description = 'Comment Preview'
 	
+	def get_queryset(self, request):
+		return super().get_queryset(request).annotate(
+			_total_reactions=_reaction_count_for(Comment),
+		).prefetch_related(_content_object_prefetch())
+
 	def total_reactions(self, obj):
-		return obj.total_reactions
+		return obj._total_reactions
 	total_reactions.short_description = 'Reactions'
+	total_reactions.admin_order_field = '_total_reactions'
+
+	# Bulk actions run as a single UPDATE rather than saving row by row.
+	@admin.action(description='Approve selected comments', permissions=['change'])
+	def approve_comments(self, request, queryset):
+		updated = queryset.update(is_approved=True, updated_at=timezone.now())
+		self.message_user(request, f'{updated} comments approved.', messages.SUCCESS)
+
+	@admin.action(description='Unapprove (hide) selected comments', permissions=['change'])
+	def unapprove_comments(self, request, queryset):
+		updated = queryset.update(is_approved=False, updated_at=timezone.now())
+		self.message_user(request, f'{updated} comments hidden.', messages.SUCCESS)
+
+	@admin.action(description='Feature selected comments', permissions=['change'])
+	def feature_comments(self, request, queryset):
+		updated = queryset.update(is_featured=True, updated_at=timezone.now())
+		self.message_user(request, f'{updated} comments featured.', messages.SUCCESS)
+
+	def delete_queryset(self, request, queryset):
+		# Reactions on the comments go too, rollups and fingerprints included;
+		# one DELETE per table.
+		with transaction.atomic():
+			ids = list(queryset.values_list('pk', flat=True))
+			delete_reactions_for(ContentType.objects.get_for_model(Comment), ids)
+			count, _ = Comment.objects.filter(pk__in=ids).delete()
+		return count
+
+	def delete_model(self, request, obj):
+		self.delete_queryset(request, Comment.objects.filter(pk=obj.pk))
+
+	def get_urls(self):
+		return [
+			path('moderation/', self.admin_site.admin_view(self.moderation_view), name='stories_comment_moderation'),
+		] + super().get_urls()
+
+	def moderation_view(self, request):
+		"""
+		Moderation queue: newest first, keyset-paginated on (created_at, id) so deep
+		pages cost the same as the first, filterable by status, IP and target object.
+		"""
+		if not self.has_view_or_change_permission(request):
+			raise PermissionDenied
+		if request.method == 'POST':
+			return self._moderate(request)
+
+		status = request.GET.get('status', 'pending')
+		ip = request.GET.get('ip', '').strip()
+		ct_id = request.GET.get('ct', '')
+		object_id = request.GET.get('object_id', '')
+
+		comments = Comment.objects.select_related('content_type').order_by('-created_at', '-id')
+		if status == 'pending':
+			comments = comments.filter(is_approved=False)
+		elif status == 'approved':
+			comments = comments.filter(is_approved=True)
+		elif status == 'featured':
+			comments = comments.filter(is_featured=True)
+		if ip:
+			comments = comments.filter(ip_address=ip)
+		if ct_id.isdigit() and object_id.isdigit():
+			comments = comments.filter(content_type_id=ct_id, object_id=object_id)
+
+		cursor = _parse_cursor(request.GET.get('before', ''))
+		if cursor:
+			before_ts, before_id = cursor
+			comments = comments.filter(Q(created_at__lt=before_ts) | Q(created_at=before_ts, id__lt=before_id))
+
+		page = list(comments.prefetch_related(_content_object_prefetch())[:self.moderation_page_size + 1])
+		next_url = None
+		if len(page) > self.moderation_page_size:
+			page = page[:self.moderation_page_size]
+			params = request.GET.copy()
+			params['before'] = f'{page[-1].created_at.isoformat()}_{page[-1].pk}'
+			next_url = '?' + params.urlencode()
+
+		first_params = request.GET.copy()
+		first_params.pop('before', None)
+		context = {
+			**self.admin_site.each_context(request),
+			'opts': self.model._meta,
+			'title': 'Comment moderation queue',
+			'comments': page,
+			'status': status,
+			'ip': ip,
+			'ct': ct_id,
+			'object_id': object_id,
+			'next_url': next_url,
+			'first_url': '?' + first_params.urlencode(),
+			'is_first_page': cursor is None,
+			'can_delete': self.has_delete_permission(request),
+		}
+		return TemplateResponse(request, 'admin/stories/comment/moderation.html', context)
+
+	def _moderate(self, request):
+		ids = [pk for pk in request.POST.getlist('ids') if pk.isdigit()]
+		action = request.POST.get('action')
+		selected = Comment.objects.filter(pk__in=ids)
+		now = timezone.now()
+		if action == 'delete':
+			if not self.has_delete_permission(request):
+				raise PermissionDenied
+			count = self.delete_queryset(request, selected)
+			self.message_user(request, f'{count} objects deleted.', messages.SUCCESS)
+		elif action in MODERATION_UPDATES:
+			if not self.has_change_permission(request):
+				raise PermissionDenied
+			count = selected.update(updated_at=now, **MODERATION_UPDATES[action])
+			self.message_user(request, f'{count} comments updated.', messages.SUCCESS)
+		else:
+			self.message_user(request, 'No action selected.', messages.WARNING)
+		return HttpResponseRedirect(request.get_full_path())
 
 @admin.register(Reaction)
 class ReactionAdmin(admin.ModelAdmin):
 	list_display = ('reaction_display', 'content_object', 'username', 'created_at')
+	list_select_related = ('content_type',)
 	list_filter = ('reaction_type', 'created_at', 'content_type')
 	search_fields = ('username',)
 	readonly_fields = ('content_object', 'created_at', 'ip_address', 'user_agent')
@@ -148,13 +464,18 @@ class ReactionAdmin(admin.ModelAdmin):
 			'all': ('admin/css/admin_rtl.css',)
 		}
 	
+	def get_queryset(self, request):
+		return super().get_queryset(request).prefetch_related(_content_object_prefetch())
+
 	def reaction_display(self, obj):
 		return format_html('<span style="font-size: 16px;">{}</span>', obj.get_reaction_type_display())
 	reaction_display.short_description = 'Reaction'
 
 @admin.register(ShortStory)
-class ShortStoryAdmin(admin.ModelAdmin):
-	list_display = ('title_en', 'title_dv', 'author', 'genre', 'category', 'published_date', 'is_featured', 'is_published', 'total_comments', 'heart_reactions')
+class ShortStoryAdmin(ListingChangeListMixin, EngagementCountsMixin, admin.ModelAdmin):
+	list_display = ('title_en', 'title_dv', 'author', 'genre', 'category', 'published_date', 'is_featured', 'is_published', 'total_views', 'total_reads', 'total_comments', 'heart_reactions')
+	list_select_related = ('author', 'genre', 'category')
+	autocomplete_fields = ('author', 'genre', 'category')
 	list_filter = ('author', 'genre', 'category', 'published_date', 'is_featured', 'is_published')
 	search_fields = ('title_en', 'title_dv', 'content_en', 'content_dv', 'author__name')
 	list_editable = ('is_featured', 'is_published')
@@ -166,7 +487,9 @@ class ShortStoryAdmin(admin.ModelAdmin):
 		'published_date',
 		'cover_image',
 		'content_dv',
+		'engagement_links',
 	)
+	readonly_fields = ('engagement_links',)
 	inlines = [CommentInline, ReactionInline]
 	date_hierarchy = 'published_date'
 	
@@ -174,12 +497,4 @@ class ShortStoryAdmin(admin.ModelAdmin):
 		css = {
 			'all': ('admin/css/admin_rtl.css',)
 		}
-	
-	def total_comments(self, obj):
-		return obj.total_comments
-	total_comments.short_description = 'Comments'
-	
-	def heart_reactions(self, obj):
-		return obj.heart_reactions
-	heart_reactions.short_description = '❤️ Hearts'
 
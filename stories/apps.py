@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class StoriesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stories'
+
+    def ready(self):
+        # Connection reuse counters hook Django signals on import.
+        import vaahakainn.dbstats  # noqa: F401
+
+        # CloudinaryField (models.py) has imported the SDK by now; only the
+        # credentials are applied here (cloudinary.api stays unloaded).
+        import cloudinary
+        from django.conf import settings
+        cloudinary.config(
+            cloud_name=settings.CLOUDINARY_CLOUD_NAME,
+            api_key=settings.CLOUDINARY_API_KEY,
+            api_secret=settings.CLOUDINARY_API_SECRET,
+            secure=True,
+        )
@@ -0,0 +1,187 @@
+"""
+Materialized data for the home page.
+
+The home page is the most-hit URL, so its cards (display fields, episode
+counts, cover URLs) are built once into a plain-data snapshot and cached; a
+request is then a single cache read. Saving or deleting a Story, Episode or
+ShortStory schedules a rebuild in a background thread after the transaction
+commits (receivers in models.py), and the snapshot also expires after
+HOME_SNAPSHOT_CACHE_SECONDS so workers with a per-process cache converge.
+
+Featured stories (Story.is_featured) come first; the remaining slots are
+filled with the latest releases. The trending row is read from the
+incrementally maintained Popularity table (popularity.py).
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from vaahakainn import metrics
+from vaahakainn.routers import use_primary
+
+from .image_placeholders import sized_url
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'home_snapshot:v3'
+STORY_CARDS = 3
+EPISODE_CARDS = 5
+SHORT_STORY_CARDS = 3
+TRENDING_CARDS = 5
+DESCRIPTION_WORDS = 20
+
+_rebuild_lock = threading.Lock()
+_rebuild_running = False
+_rebuild_requested = False
+
+
+def _cover(image, width, height, placeholder):
+	"""Card fields for a cover: the 400px rendition, a 2x srcset, intrinsic size and placeholder."""
+	return {
+		'cover_url': sized_url(image, 400),
+		'cover_srcset': f'{sized_url(image, 400)} 400w, {sized_url(image, 800)} 800w' if image else '',
+		'cover_width': width,
+		'cover_height': height,
+		'cover_placeholder': placeholder,
+	}
+
+
+def _story_card(story):
+	return {
+		'pk': story.pk,
+		'title': story.title,
+		'title_dv': story.title_dv,
+		'title_en': story.title_en,
+		'description': Truncator(story.description).words(DESCRIPTION_WORDS),
+		'description_dv': Truncator(story.description_dv).words(DESCRIPTION_WORDS),
+		'description_en': Truncator(story.description_en).words(DESCRIPTION_WORDS),
+		'status': story.status,
+		'release_date': story.release_date,
+		'is_featured': story.is_featured,
+		'category_name': story.category.name if story.category else '',
+		'episode_count': story.episode_count,
+		**_cover(story.cover_image, story.cover_image_width, story.cover_image_height, story.cover_image_placeholder),
+	}
+
+
+def home_querysets():
+	"""The queries behind the home page cards (manage.py check_query_plans EXPLAINs these)."""
+	from .models import Episode, ShortStory, Story
+
+	stories = Story.objects.select_related('category').with_episode_count()
+	return {
+		'stories': stories,
+		'featured_stories': stories.filter(is_featured=True).order_by('-release_date')[:STORY_CARDS],
+		'latest_stories': stories.filter(is_featured=False).order_by('-release_date'),
+		'latest_episodes': (
+			Episode.objects.for_listing().select_related('story')
+			.order_by('-published_date')[:EPISODE_CARDS]
+		),
+		'featured_short_stories': (
+			ShortStory.objects.for_listing().select_related('author')
+			.filter(is_published=True, is_featured=True).order_by('-published_date')[:SHORT_STORY_CARDS]
+		),
+	}
+
+
+def build_home_snapshot():
+	from .models import Story
+	from .popularity import trending
+
+	queries = home_querysets()
+	stories = queries['stories']
+	featured = list(queries['featured_stories'])
+	if len(featured) < STORY_CARDS:
+		featured += list(queries['latest_stories'][:STORY_CARDS - len(featured)])
+	episodes = queries['latest_episodes']
+	short_stories = queries['featured_short_stories']
+
+	return {
+		'featured_stories': [_story_card(story) for story in featured],
+		'trending_stories': [_story_card(story) for story in trending(Story, TRENDING_CARDS, queryset=stories)],
+		'featured_episodes': [
+			{
+				'pk': episode.pk,
+				'episode_number': episode.episode_number,
+				'title_dv': episode.title_dv,
+				'title_en': episode.title_en,
+				'published_date': episode.published_date,
+				'story_pk': episode.story_id,
+				'story_title': str(episode.story) if episode.story else '',
+			}
+			for episode in episodes
+		],
+		'featured_short_stories': [
+			{
+				'pk': short_story.pk,
+				'title_dv': short_story.title_dv,
+				'title_en': short_story.title_en,
+				'published_date': short_story.published_date,
+				'author_name': short_story.author.name,
+				**_cover(
+					short_story.cover_image, short_story.cover_image_width,
+					short_story.cover_image_height, short_story.cover_image_placeholder,
+				),
+			}
+			for short_story in short_stories
+		],
+		'built_at': timezone.now(),
+	}
+
+
+def rebuild_home_snapshot():
+	snapshot = build_home_snapshot()
+	cache.set(SNAPSHOT_KEY, snapshot, getattr(settings, 'HOME_SNAPSHOT_CACHE_SECONDS', 300))
+	return snapshot
+
+
+def get_home_snapshot():
+	snapshot = cache.get(SNAPSHOT_KEY)
+	metrics.inc('cache_requests_total', cache='home_snapshot', result='miss' if snapshot is None else 'hit')
+	if snapshot is None:
+		snapshot = rebuild_home_snapshot()
+	return snapshot
+
+
+def _rebuild_in_background():
+	global _rebuild_running, _rebuild_requested
+	try:
+		while True:
+			with _rebuild_lock:
+				if not _rebuild_requested:
+					_rebuild_running = False
+					return
+				_rebuild_requested = False
+			try:
+				# A rebuild always follows a write, and this thread doesn't inherit
+				# the request's primary pinning: read from the primary so a lagging
+				# replica can't cache a snapshot without the new rows.
+				with use_primary():
+					rebuild_home_snapshot()
+			except Exception:
+				logger.exception('Home snapshot rebuild failed')
+				cache.delete(SNAPSHOT_KEY)
+	finally:
+		# This thread opened its own connection; don't leak it.
+		connection.close()
+
+
+def _start_rebuild():
+	global _rebuild_running, _rebuild_requested
+	with _rebuild_lock:
+		_rebuild_requested = True
+		if _rebuild_running:
+			return  # the running thread picks the new request up
+		_rebuild_running = True
+	threading.Thread(target=_rebuild_in_background, name='home-snapshot', daemon=True).start()
+
+
+def schedule_home_snapshot_rebuild():
+	"""Rebuild the snapshot in the background once the current transaction commits."""
+	transaction.on_commit(_start_rebuild)
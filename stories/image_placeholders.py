@@ -0,0 +1,188 @@
+"""
+Intrinsic sizes and blurred placeholders for cover and profile images.
+
+Story and ShortStory covers and Author profile images are stored with their
+width, height and a tiny blurred rendition as a data: URI (a few hundred
+bytes) in <field>_width, <field>_height and <field>_placeholder. Templates put
+the size on the <img> so the card keeps its shape while the image loads, and
+the placeholder behind it as a background.
+
+Saving a new image clears the three columns (receivers in models.py); once the
+transaction commits, a background thread fills them in:
+  IMAGE_PIPELINE = 'cloudinary'  explicit() asks Cloudinary to generate the
+                                 derived sizes the pages use (COVER_EAGER_WIDTHS)
+                                 and returns the original's size; the
+                                 placeholder is a PLACEHOLDER_WIDTH-px blurred
+                                 rendition fetched from Cloudinary
+  IMAGE_PIPELINE = 'local'       the image is read from MEDIA_ROOT (or its URL)
+                                 and measured and shrunk with Pillow
+The default is 'cloudinary' when CLOUDINARY_CLOUD_NAME is set, 'local'
+otherwise. Pages request the eager sizes through the `sized` template filter
+(templatetags/images.py). manage.py process_images fills in rows saved before
+this existed.
+"""
+
+import base64
+import io
+import logging
+import os
+import queue
+import threading
+import urllib.request
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+
+from vaahakainn.routers import use_primary
+
+logger = logging.getLogger(__name__)
+
+# model label -> image field
+IMAGE_FIELDS = {
+	'stories.Story': 'cover_image',
+	'stories.ShortStory': 'cover_image',
+	'stories.Author': 'profile_image',
+}
+PLACEHOLDER_WIDTH = 24
+FETCH_TIMEOUT = 20
+
+_jobs = queue.SimpleQueue()
+_worker_lock = threading.Lock()
+_worker_running = False
+
+
+def image_field(model):
+	return IMAGE_FIELDS.get(model._meta.label)
+
+
+def image_key(value):
+	"""What identifies a stored image: the Cloudinary public id (or the raw stored string)."""
+	return str(getattr(value, 'public_id', None) or value or '')
+
+
+def cleared_details(field):
+	return {f'{field}_width': None, f'{field}_height': None, f'{field}_placeholder': ''}
+
+
+def _data_uri(jpeg):
+	return 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii')
+
+
+def _fetch(url):
+	with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+		return response.read()
+
+
+def _pipeline():
+	return getattr(settings, 'IMAGE_PIPELINE', '') or (
+		'cloudinary' if getattr(settings, 'CLOUDINARY_CLOUD_NAME', '') else 'local'
+	)
+
+
+def _eager_transformation(width):
+	return {'width': width, 'crop': 'limit', 'quality': 'auto', 'fetch_format': 'auto'}
+
+
+def sized_url(image, width):
+	"""URL of the derived rendition of `image` at most `width` px wide (the original without Cloudinary)."""
+	if not image:
+		return ''
+	if _pipeline() != 'cloudinary':
+		return image.url
+	return image.build_url(**_eager_transformation(width))
+
+
+def describe_image_bytes(data):
+	"""(width, height, placeholder data URI) for the bytes of an image file, using Pillow."""
+	from PIL import Image, ImageFilter, ImageOps
+
+	with Image.open(io.BytesIO(data)) as image:
+		image = ImageOps.exif_transpose(image)
+		width, height = image.size
+		thumbnail = image.convert('RGB')
+		thumbnail.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4))
+		thumbnail = thumbnail.filter(ImageFilter.GaussianBlur(1))
+		output = io.BytesIO()
+		thumbnail.save(output, 'JPEG', quality=40, optimize=True)
+	return width, height, _data_uri(output.getvalue())
+
+
+def _describe_local(image):
+	path = os.path.join(settings.MEDIA_ROOT, image_key(image))
+	if os.path.isfile(path):
+		with open(path, 'rb') as handle:
+			return describe_image_bytes(handle.read())
+	return describe_image_bytes(_fetch(image.url))
+
+
+def _describe_cloudinary(image):
+	import cloudinary.uploader
+
+	eager = [_eager_transformation(width) for width in getattr(settings, 'COVER_EAGER_WIDTHS', (400, 800))]
+	result = cloudinary.uploader.explicit(image.public_id, type='upload', eager=eager, eager_async=True)
+	tiny = _fetch(image.build_url(
+		width=PLACEHOLDER_WIDTH, crop='scale', effect='blur:300', quality=40, format='jpg',
+	))
+	return result['width'], result['height'], _data_uri(tiny)
+
+
+def describe(image):
+	return _describe_cloudinary(image) if _pipeline() == 'cloudinary' else _describe_local(image)
+
+
+def process(model, pk):
+	"""Measure one row's image and store its details; returns True if they were written."""
+	field = image_field(model)
+	obj = model._default_manager.only('pk', field).filter(pk=pk).first()
+	image = getattr(obj, field, None)
+	if not image:
+		return False
+	width, height, placeholder = describe(image)
+	with transaction.atomic():
+		rows = model._default_manager.select_for_update().filter(pk=pk)
+		# Skip the write if the image was replaced while we were working on it.
+		if image_key(rows.values_list(field, flat=True).first()) != image_key(image):
+			return False
+		return bool(rows.update(**{
+			f'{field}_width': width, f'{field}_height': height, f'{field}_placeholder': placeholder,
+		}))
+
+
+def _work():
+	global _worker_running
+	try:
+		while True:
+			try:
+				label, pk = _jobs.get(timeout=1)
+			except queue.Empty:
+				with _worker_lock:
+					if _jobs.empty():
+						_worker_running = False
+						return
+				continue
+			try:
+				# Jobs follow a save; a lagging replica may not have the row yet.
+				with use_primary():
+					process(apps.get_model(label), pk)
+			except Exception:
+				logger.exception('Processing the image of %s #%s failed', label, pk)
+	finally:
+		# This thread opened its own connection; don't leak it.
+		connection.close()
+
+
+def _enqueue(label, pk):
+	global _worker_running
+	_jobs.put((label, pk))
+	with _worker_lock:
+		if _worker_running:
+			return
+		_worker_running = True
+	threading.Thread(target=_work, name='image-placeholders', daemon=True).start()
+
+
+def schedule(instance):
+	"""Process `instance`'s image in the background once the current transaction commits."""
+	label, pk = instance._meta.label, instance.pk
+	transaction.on_commit(lambda: _enqueue(label, pk))
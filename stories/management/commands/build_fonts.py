@@ -0,0 +1,125 @@
+"""
+Build the self-hosted web fonts: subset each source font into a Thaana and a
+Latin WOFF2 file and regenerate static/fonts/faruma.css with one @font-face
+per file (font-display: swap, unicode-range), so a page only downloads the
+subsets its text uses. Run it after changing FONTS and commit the output:
+  manage.py build_fonts
+
+base.html preloads the subsets marked preload=True (the lines to use are
+printed at the end); everything is served through the static pipeline, so the
+hashed names collectstatic produces are cached as immutable.
+
+Needs fontTools (pip install fonttools brotli); the site itself does not.
+"""
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+FONT_DIR = os.path.join('static', 'fonts')
+
+# Source fonts (relative to FONT_DIR). Add a file per weight to self-host more.
+FONTS = [
+    {'family': 'Faruma', 'source': 'Faruma.ttf', 'weight': 400, 'style': 'normal'},
+]
+
+# name -> (unicode-range, preload). Thaana carries the body text of every
+# Dhivehi page; Latin (digits, punctuation, English UI strings) is small and
+# only fetched when used.
+SUBSETS = {
+    'thaana': ('U+0780-07BF, U+060C, U+061B, U+061F, U+200C-200F, U+25CC, U+FDF2', True),
+    'latin': (
+        'U+0000-00FF, U+0131, U+0152-0153, U+02BB-02BC, U+02C6, U+02DA, U+02DC, '
+        'U+2000-206F, U+2074, U+20AC, U+2122, U+2191, U+2193, U+2212, U+2215, U+FEFF, U+FFFD',
+        False,
+    ),
+}
+
+CSS_HEADER = """/* Generated by `manage.py build_fonts` from stories/management/commands/build_fonts.py; do not edit. */
+"""
+
+FONT_FACE = """
+@font-face {{
+    font-family: '{family}';
+    src: url('{filename}') format('woff2');
+    font-weight: {weight};
+    font-style: {style};
+    font-display: swap;
+    unicode-range: {unicode_range};
+}}
+"""
+
+FARUMA_CLASS = """
+.faruma {
+    font-family: 'Faruma', 'Noto Sans Dhivehi', Arial, sans-serif !important;
+    font-weight: normal;
+    line-height: 1.6;
+    direction: rtl !important;
+    text-align: right !important;
+    /* Prevent text shrinking on mobile */
+    -webkit-text-size-adjust: 100%;
+    text-size-adjust: 100%;
+}
+"""
+
+
+def parse_unicode_range(value):
+    """Set of code points in a CSS unicode-range value."""
+    codepoints = set()
+    for part in value.split(','):
+        part = part.strip().upper().removeprefix('U+')
+        start, _, end = part.partition('-')
+        codepoints.update(range(int(start, 16), int(end or start, 16) + 1))
+    return codepoints
+
+
+def output_name(font, subset):
+    return f"{font['family'].lower().replace(' ', '-')}-{font['weight']}-{subset}.woff2"
+
+
+class Command(BaseCommand):
+    help = 'Subset the source fonts into Thaana/Latin WOFF2 files and regenerate static/fonts/faruma.css.'
+
+    def handle(self, *args, **options):
+        try:
+            from fontTools import subset
+            from fontTools.ttLib import TTFont
+        except ImportError:
+            raise CommandError('build_fonts needs fontTools: pip install fonttools brotli')
+
+        font_dir = os.path.join(settings.BASE_DIR, FONT_DIR)
+        css = [CSS_HEADER]
+        preloads = []
+        for font in FONTS:
+            source = os.path.join(font_dir, font['source'])
+            covered = set(TTFont(source).getBestCmap())
+            for name, (unicode_range, preload) in SUBSETS.items():
+                unicodes = parse_unicode_range(unicode_range) & covered
+                if not unicodes:
+                    continue
+                filename = output_name(font, name)
+                subset_options = subset.Options()
+                subset_options.flavor = 'woff2'
+                subset_options.layout_features = ['*']  # keep Thaana mark positioning
+                subset_options.desubroutinize = True
+                font_file = subset.load_font(source, subset_options)
+                subsetter = subset.Subsetter(subset_options)
+                subsetter.populate(unicodes=unicodes)
+                subsetter.subset(font_file)
+                subset.save_font(font_file, os.path.join(font_dir, filename), subset_options)
+
+                size = os.path.getsize(os.path.join(font_dir, filename))
+                self.stdout.write(f'{filename}: {len(unicodes)} code points, {size / 1024:.1f} KB')
+                css.append(FONT_FACE.format(filename=filename, unicode_range=unicode_range, **font))
+                if preload:
+                    preloads.append(filename)
+
+        css.append(FARUMA_CLASS)
+        with open(os.path.join(font_dir, 'faruma.css'), 'w') as handle:
+            handle.write(''.join(css))
+        self.stdout.write(self.style.SUCCESS('Wrote static/fonts/faruma.css. Preload in base.html:'))
+        for filename in preloads:
+            self.stdout.write(
+                f'    <link rel="preload" href="{{% static \'fonts/{filename}\' %}}" as="font" type="font/woff2" crossorigin>'
+            )
@@ -0,0 +1,96 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from stories.home_snapshot import home_querysets
+from stories.models import Episode, Reaction, ReactionRollup, Story, reaction_querysets
+from stories.toc import toc_queryset
+from stories.views import approved_comments, short_story_list_queryset, story_list_queryset
+
+
+# The querysets come from the helpers the views and the home snapshot build
+# them with, so this checks the queries production actually runs. Cached data
+# (story TOCs, the home snapshot) is EXPLAINed at its build query.
+
+
+def _sample_id(model):
+    return model.objects.order_by('pk').values_list('pk', flat=True).first() or 1
+
+
+def _target_indexes(model, alias):
+    """Names of the indexes on `model` that lead with (content_type, object_id), e.g. unique_together's."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    names = [
+        name for name, info in constraints.items()
+        if info['columns'][:2] == ['content_type_id', 'object_id'] and (info['index'] or info['unique'])
+    ]
+    if connection.vendor == 'sqlite':
+        # SQLite backs table-level UNIQUE constraints with sqlite_autoindex_<table>_N.
+        names.append(f'sqlite_autoindex_{model._meta.db_table}_')
+    return names
+
+
+def _view_queries(alias):
+    """(label, queryset, acceptable index names) for the hot queries of each view."""
+    story_id = _sample_id(Story)
+    episode_id = _sample_id(Episode)
+    episode_ct = ContentType.objects.get_for_model(Episode)
+    category_id = Story.objects.exclude(category=None).values_list('category_id', flat=True).first() or 1
+    home = home_querysets()
+    recent_hearts, rolled_up_hearts = reaction_querysets(episode_ct, episode_id, 'heart')
+
+    return [
+        ('home: featured stories', home['featured_stories'], ['story_featured_release_idx']),
+        ('home: latest stories', home['latest_stories'][:3], ['story_release_idx']),
+        ('home: latest episodes', home['latest_episodes'], ['episode_published_idx']),
+        ('home: featured short stories', home['featured_short_stories'], ['shortstory_featured_idx']),
+        ('story_list: all', story_list_queryset()[:12], ['story_release_idx']),
+        ('story_list: by category', story_list_queryset(category_id), ['story_category_release_idx']),
+        ('story_detail: table of contents', toc_queryset(story_id), ['episode_story_number_idx']),
+        ('episode_detail: comments', approved_comments(episode_ct, episode_id), ['comment_approved_target_idx']),
+        ('short_story_list: published', short_story_list_queryset(), ['shortstory_published_idx']),
+        ('short_story_list: by category', short_story_list_queryset(category_id), ['shortstory_category_pub_idx']),
+        ('reactions: recent hearts', recent_hearts, _target_indexes(Reaction, alias)),
+        ('reactions: rolled-up hearts', rolled_up_hearts, _target_indexes(ReactionRollup, alias)),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the queries behind each public view and check they use the '
+        'indexes meant for them. Exits non-zero if any query does not.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every query plan')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        vendor = connections[alias].vendor
+        failures = 0
+
+        with transaction.atomic(using=alias):
+            if vendor == 'postgresql':
+                # Tiny dev/staging tables make a seq scan the cheapest plan; forbid
+                # it so we see which index the planner would use at scale.
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for label, queryset, expected in _view_queries(alias):
+                plan = queryset.using(alias).explain()
+                used = [name for name in expected if name in plan]
+                if used:
+                    self.stdout.write(self.style.SUCCESS(f'OK    {label} -> {used[0]}'))
+                else:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(f'FAIL  {label} (expected one of: {", ".join(expected)})'))
+                if options['verbose_plans'] or not used:
+                    for line in plan.splitlines():
+                        self.stdout.write(f'        {line}')
+
+        if failures:
+            raise CommandError(f'{failures} view queries are not using their indexes.')
+        self.stdout.write(self.style.SUCCESS('All view queries use their indexes.'))
@@ -1,45 +1,231 @@
-from django.core.management.base import BaseCommand
+"""
+Catalogue maintenance for episodes: relink episodes to stories, renumber them
+and check numbering integrity, using set-based UPDATEs and streamed reads so it
+is safe to run against the full production table.
+
+Examples:
+  manage.py fix_episodes --check
+  manage.py fix_episodes --story 3 --title-prefix "Hiyani" --dry-run
+  manage.py fix_episodes --story 3 --date-from 2024-01-01 --date-to 2024-06-30 --unlinked-only
+  manage.py fix_episodes --mapping relink.csv          # episode_id,story_id[,episode_number]
+  manage.py fix_episodes --renumber --story 3
+"""
+
+import csv
+import json
+from itertools import groupby
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Min, Q, Value, When
+from django.utils.dateparse import parse_date
+
 from stories.models import Episode, Story
+from stories.home_snapshot import rebuild_home_snapshot
+from stories.toc import invalidate_all_tocs
+
+BATCH_SIZE = 500
+
+
+def _chunks(items, size=BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _read_mapping(path):
+    """Rows of (episode_id, story_id, episode_number or None) from a CSV or JSON file."""
+    path = Path(path)
+    if not path.exists():
+        raise CommandError(f'{path}: no such file')
+    if path.suffix == '.json':
+        rows = [(r['episode_id'], r['story_id'], r.get('episode_number')) for r in json.loads(path.read_text())]
+    else:
+        with path.open(newline='', encoding='utf-8') as handle:
+            rows = [
+                (r[0], r[1], r[2] if len(r) > 2 and r[2] else None)
+                for r in csv.reader(handle)
+                if r and r[0].strip().isdigit()  # skips a header row
+            ]
+    try:
+        return [(int(e), int(s), int(n) if n not in (None, '') else None) for e, s, n in rows]
+    except (TypeError, ValueError):
+        raise CommandError(f'{path}: episode_id, story_id and episode_number must be whole numbers')
+
 
 class Command(BaseCommand):
-    help = 'Fix episode linking to stories'
+    help = 'Relink and renumber episodes with set-based updates, and check episode numbering per story.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--story', type=int, help='Target story id for --title-prefix/--date-* rules; limits --renumber and --check')
+        parser.add_argument('--title-prefix', help='Select episodes whose Dhivehi or English title starts with this')
+        parser.add_argument('--date-from', help='Select episodes published on or after YYYY-MM-DD')
+        parser.add_argument('--date-to', help='Select episodes published on or before YYYY-MM-DD')
+        parser.add_argument('--unlinked-only', action='store_true', help='Only select episodes not linked to any story')
+        parser.add_argument('--mapping', help='CSV or JSON file of episode_id, story_id[, episode_number]')
+        parser.add_argument('--renumber', action='store_true', help='Renumber episodes 1..n per story, keeping their current order')
+        parser.add_argument('--check', action='store_true', help='Report duplicate and missing episode numbers per story')
+        parser.add_argument('--dry-run', action='store_true', help='Print the changes without writing them')
 
     def handle(self, *args, **options):
-        self.stdout.write('Checking episodes and stories...\n')
-        
-        # Show all episodes
-        episodes = Episode.objects.all().order_by('episode_number')
-        self.stdout.write(f'Found {episodes.count()} episodes:')
-        for ep in episodes:
-            self.stdout.write(f'  - Episode {ep.episode_number}: {ep.title_dv}')
-        
-        # Show all stories
-        stories = Story.objects.all()
-        self.stdout.write(f'\nFound {stories.count()} stories:')
-        for story in stories:
-            self.stdout.write(f'  - Story: {story.title}')
-            linked = story.episodes.order_by('episode_number')
-            self.stdout.write(f'    Currently has {linked.count()} episodes linked:')
-            for ep in linked:
-                self.stdout.write(f'      * Episode {ep.episode_number}: {ep.title_dv}')
-        
-        # Fix: Link all episodes to the first story
-        if stories.exists() and episodes.exists():
-            story = stories.first()
-            self.stdout.write(f'\nLinking all episodes to story: {story.title}')
-            
-            for episode in episodes:
-                story.episodes.add(episode)
-                self.stdout.write(f'  ✓ Added Episode {episode.episode_number}')
-            
-            story.save()
-            self.stdout.write('\nStory saved!')
-            
-            # Verify the fix
-            self.stdout.write('\nAfter linking:')
-            linked = story.episodes.order_by('episode_number')
-            self.stdout.write(f'Story "{story.title}" now has {linked.count()} episodes:')
-            for ep in linked:
-                self.stdout.write(f'  - Episode {ep.episode_number}: {ep.title_dv}')
-        
-        self.stdout.write('\n✅ Episode linking fixed!')
\ No newline at end of file
+        self.dry_run = options['dry_run']
+        has_rule = options['title_prefix'] or options['date_from'] or options['date_to']
+        writes = has_rule or options['mapping'] or options['renumber']
+        if not (writes or options['check']):
+            options['check'] = True
+
+        with transaction.atomic():
+            if has_rule:
+                self.relink_by_rule(options)
+            if options['mapping']:
+                self.relink_by_mapping(_read_mapping(options['mapping']))
+            if options['renumber']:
+                self.renumber(options['story'])
+            if self.dry_run:
+                transaction.set_rollback(True)
+
+        if writes and not self.dry_run:
+            # QuerySet.update() skips the receivers that keep story TOCs and the
+            # home snapshot (episode counts) fresh. The snapshot is rebuilt here
+            # rather than in the receivers' background thread, which would die
+            # with this process.
+            invalidate_all_tocs()
+            rebuild_home_snapshot()
+
+        if options['check']:
+            self.check_integrity(options['story'])
+
+    def relink_by_rule(self, options):
+        if not options['story']:
+            raise CommandError('--story is required with --title-prefix / --date-from / --date-to')
+        if not Story.objects.filter(pk=options['story']).exists():
+            raise CommandError(f'Story {options["story"]} does not exist')
+
+        selected = Episode.objects.exclude(story_id=options['story'])
+        if options['unlinked_only']:
+            selected = selected.filter(story=None)
+        if options['title_prefix']:
+            prefix = options['title_prefix']
+            selected = selected.filter(Q(title_dv__startswith=prefix) | Q(title_en__startswith=prefix))
+        for option, lookup in (('date_from', 'published_date__gte'), ('date_to', 'published_date__lte')):
+            if options[option]:
+                day = parse_date(options[option])
+                if day is None:
+                    raise CommandError(f'--{option.replace("_", "-")} must be YYYY-MM-DD')
+                selected = selected.filter(**{lookup: day})
+
+        for episode in selected.for_listing().order_by('pk').iterator(chunk_size=BATCH_SIZE):
+            self.stdout.write(f'~ Episode #{episode.pk} ({episode.episode_number}: {episode.title_dv}): '
+                              f'story {episode.story_id} -> {options["story"]}')
+        updated = selected.update(story_id=options['story'])
+        self.stdout.write(f'{self._verb()} {updated} episodes to story {options["story"]}.')
+
+    def relink_by_mapping(self, rows):
+        unknown = {s for _, s, _ in rows} - set(Story.objects.filter(pk__in={s for _, s, _ in rows}).values_list('pk', flat=True))
+        if unknown:
+            raise CommandError(f'Mapping refers to unknown stories: {sorted(unknown)}')
+
+        current = {}
+        for chunk in _chunks(rows):
+            current.update(
+                (pk, (story_id, number))
+                for pk, story_id, number in Episode.objects.filter(pk__in=[r[0] for r in chunk])
+                .values_list('pk', 'story_id', 'episode_number').iterator()
+            )
+        missing = [r[0] for r in rows if r[0] not in current]
+        if missing:
+            raise CommandError(f'Mapping refers to unknown episodes: {missing[:20]}{" ..." if len(missing) > 20 else ""}')
+
+        changes = [
+            (pk, story_id, number) for pk, story_id, number in rows
+            if current[pk] != (story_id, current[pk][1] if number is None else number)
+        ]
+        for pk, story_id, number in changes:
+            old_story, old_number = current[pk]
+            new_number = old_number if number is None else number
+            self.stdout.write(f'~ Episode #{pk}: story {old_story} -> {story_id}, number {old_number} -> {new_number}')
+
+        # One UPDATE per target story per batch, with episode numbers set via CASE.
+        changes.sort(key=lambda row: row[1])
+        for story_id, group in groupby(changes, key=lambda row: row[1]):
+            for chunk in _chunks(list(group)):
+                numbered = [(pk, number) for pk, _, number in chunk if number is not None]
+                fields = {'story_id': story_id}
+                if numbered:
+                    fields['episode_number'] = Case(
+                        *[When(pk=pk, then=Value(number)) for pk, number in numbered],
+                        default='episode_number',
+                        output_field=IntegerField(),
+                    )
+                Episode.objects.filter(pk__in=[pk for pk, _, _ in chunk]).update(**fields)
+        self.stdout.write(f'{self._verb()} {len(changes)} episodes from the mapping.')
+
+    def renumber(self, story_id):
+        episodes = Episode.objects.exclude(story=None)
+        if story_id:
+            episodes = episodes.filter(story_id=story_id)
+        rows = episodes.order_by('story_id', 'episode_number', 'published_date', 'pk').values_list(
+            'pk', 'story_id', 'episode_number',
+        )
+
+        # Stream the ordering and keep only the (pk, number) pairs that change; the
+        # updates run after the read finishes so they never disturb the cursor.
+        changes = []
+        for _, story_rows in groupby(rows.iterator(chunk_size=BATCH_SIZE), key=lambda row: row[1]):
+            for position, (pk, sid, number) in enumerate(story_rows, start=1):
+                if number != position:
+                    self.stdout.write(f'~ Episode #{pk} in story {sid}: number {number} -> {position}')
+                    changes.append((pk, position))
+
+        for chunk in _chunks(changes):
+            Episode.objects.filter(pk__in=[pk for pk, _ in chunk]).update(episode_number=Case(
+                *[When(pk=pk, then=Value(number)) for pk, number in chunk],
+                output_field=IntegerField(),
+            ))
+        self.stdout.write(f'{self._verb()} {len(changes)} episodes.')
+
+    def check_integrity(self, story_id):
+        episodes = Episode.objects.all()
+        if story_id:
+            episodes = episodes.filter(story_id=story_id)
+        problems = 0
+
+        duplicates = (
+            episodes.exclude(story=None).values('story_id', 'episode_number')
+            .annotate(n=Count('pk')).filter(n__gt=1).order_by('story_id', 'episode_number')
+        )
+        for row in duplicates.iterator():
+            problems += 1
+            self.stdout.write(self.style.WARNING(
+                f'Story {row["story_id"]}: episode number {row["episode_number"]} is used {row["n"]} times'
+            ))
+
+        # A story numbered exactly 1..n has min 1, max n and n distinct numbers.
+        suspicious = (
+            episodes.exclude(story=None).values('story_id')
+            .annotate(n=Count('episode_number', distinct=True), low=Min('episode_number'), high=Max('episode_number'))
+            .exclude(low=1, high=F('n'))
+            .order_by('story_id')
+        )
+        for row in suspicious.iterator():
+            present = set(
+                Episode.objects.filter(story_id=row['story_id']).values_list('episode_number', flat=True).iterator()
+            )
+            missing = [n for n in range(1, row['high'] + 1) if n not in present]
+            if missing:
+                problems += 1
+                shown = ', '.join(map(str, missing[:20])) + (' ...' if len(missing) > 20 else '')
+                self.stdout.write(self.style.WARNING(f'Story {row["story_id"]}: missing episode numbers {shown}'))
+
+        unlinked = episodes.filter(story=None).count()
+        if unlinked:
+            problems += 1
+            self.stdout.write(self.style.WARNING(f'{unlinked} episodes are not linked to any story'))
+
+        if problems:
+            self.stdout.write(self.style.WARNING(f'{problems} numbering problems found.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Episode numbering is consistent.'))
+
+    def _verb(self):
+        return 'Would update' if self.dry_run else 'Updated'
@@ -0,0 +1,238 @@
+"""
+Bulk import of episodes and short stories.
+
+Sources (any mix, given as arguments):
+  * a directory          -> every *.md, *.json and *.jsonl file inside it, sorted by name
+  * *.md                 -> front matter ("key: value" lines between --- markers) plus a body;
+                            the body is the Dhivehi text, and anything after a line reading
+                            <!-- en --> is the English text
+  * *.json               -> one record object, or a list of them
+  * *.jsonl / -          -> one record object per line (- reads stdin)
+
+A record is an episode unless it has "type": "short_story". Fields mirror the
+models; foreign keys may be given by id or by name/title:
+  episode:     story, episode_number, title_dv, title_en, content_dv, content_en,
+               published_date (YYYY-MM-DD), author, genre
+  short story: title_dv, title_en, content_dv, content_en, published_date, author,
+               genre, category, is_featured, is_published
+title_en and content_en are optional, as in the admin.
+
+Everything is validated first; nothing is written if any record is invalid.
+Rows are inserted with bulk_create in one transaction, so no per-row post_save
+notification fires, and a single summary is posted to Telegram at the end.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from stories.models import Author, Category, Episode, Genre, ShortStory, Story, suppress_notifications
+
+EN_MARKER = '<!-- en -->'
+SOURCE_SUFFIXES = ('.md', '.json', '.jsonl')
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+# The admin only asks for the Dhivehi text; the English fields may stay empty.
+OPTIONAL_FIELDS = ['title_en', 'content_en']
+
+
+def _parse_markdown(text):
+    record = {}
+    body = text
+    lines = text.splitlines()
+    if lines and lines[0].strip() == '---':
+        for index, line in enumerate(lines[1:], start=1):
+            if line.strip() == '---':
+                body = '\n'.join(lines[index + 1:])
+                break
+            key, sep, value = line.partition(':')
+            if sep:
+                record[key.strip()] = value.strip().strip('"\'')
+        else:
+            raise ValueError('front matter is not closed with ---')
+    content_dv, _, content_en = body.partition(EN_MARKER)
+    record.setdefault('content_dv', content_dv.strip())
+    record.setdefault('content_en', content_en.strip())
+    return record
+
+
+def _record(location, value):
+    if not isinstance(value, dict):
+        raise CommandError(f'{location}: a record must be a JSON object, not {type(value).__name__}')
+    return location, value
+
+
+def _iter_records(source):
+    """Yield (location, record dict) pairs from one command-line source."""
+    if source == '-':
+        for number, line in enumerate(sys.stdin, start=1):
+            if line.strip():
+                yield _record(f'<stdin>:{number}', json.loads(line))
+        return
+
+    path = Path(source)
+    if path.is_dir():
+        for child in sorted(p for p in path.iterdir() if p.suffix in SOURCE_SUFFIXES):
+            yield from _iter_records(str(child))
+        return
+    if not path.exists():
+        raise CommandError(f'{source}: no such file or directory')
+
+    text = path.read_text(encoding='utf-8')
+    if path.suffix == '.md':
+        yield str(path), _parse_markdown(text)
+    elif path.suffix == '.jsonl':
+        for number, line in enumerate(text.splitlines(), start=1):
+            if line.strip():
+                yield _record(f'{path}:{number}', json.loads(line))
+    else:
+        data = json.loads(text)
+        for number, record in enumerate(data if isinstance(data, list) else [data], start=1):
+            yield _record(f'{path}[{number}]', record)
+
+
+class _Lookup:
+    """Resolves foreign keys given by id or name, caching each table once."""
+
+    def __init__(self, model, name_fields):
+        self.by_id = {}
+        self.by_name = {}
+        for obj in model.objects.only('pk', *name_fields):
+            self.by_id[obj.pk] = obj
+            for field in name_fields:
+                value = getattr(obj, field)
+                if value:
+                    self.by_name.setdefault(value.strip().lower(), obj)
+        self.label = model._meta.verbose_name
+
+    def __call__(self, value, required=True):
+        if value in (None, ''):
+            if required:
+                raise ValidationError(f'{self.label} is required')
+            return None
+        if isinstance(value, int) or str(value).isdigit():
+            obj = self.by_id.get(int(value))
+        else:
+            obj = self.by_name.get(str(value).strip().lower())
+        if obj is None:
+            raise ValidationError(f'unknown {self.label}: {value!r}')
+        return obj
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import episodes and short stories from Markdown/JSON files or a JSONL stream.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='+', help='Files, directories, or - for JSONL on stdin')
+        parser.add_argument('--batch-size', type=int, default=100, help='Rows per INSERT')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only; write nothing')
+        parser.add_argument('--skip-existing', action='store_true',
+                            help='Skip episodes whose story already has that episode number instead of failing')
+        parser.add_argument('--no-notify', action='store_true', help='Do not post the summary to Telegram')
+
+    def handle(self, *args, **options):
+        self.stories = _Lookup(Story, ('title_en', 'title_dv', 'title'))
+        self.authors = _Lookup(Author, ('name',))
+        self.genres = _Lookup(Genre, ('name',))
+        self.categories = _Lookup(Category, ('name',))
+        self.existing_numbers = set(
+            Episode.objects.exclude(story=None).values_list('story_id', 'episode_number').iterator()
+        )
+
+        episodes, short_stories, errors, skipped = [], [], [], 0
+        for source in options['sources']:
+            try:
+                records = list(_iter_records(source))
+            except (ValueError, OSError) as exc:
+                raise CommandError(f'{source}: {exc}')
+            for location, record in records:
+                try:
+                    if record.get('type', 'episode') == 'short_story':
+                        short_stories.append(self._build_short_story(record))
+                    else:
+                        episode = self._build_episode(record)
+                        key = (episode.story_id, episode.episode_number)
+                        if episode.story_id and key in self.existing_numbers:
+                            if options['skip_existing']:
+                                skipped += 1
+                                continue
+                            raise ValidationError(f'episode {episode.episode_number} already exists in story {episode.story_id}')
+                        self.existing_numbers.add(key)
+                        episodes.append(episode)
+                except ValidationError as exc:
+                    errors.append(f'{location}: {"; ".join(exc.messages)}')
+
+        if errors:
+            for error in errors:
+                self.stderr.write(error)
+            raise CommandError(f'{len(errors)} invalid records; nothing imported.')
+
+        self.stdout.write(f'Validated {len(episodes)} episodes and {len(short_stories)} short stories'
+                          f'{f" ({skipped} existing episodes skipped)" if skipped else ""}.')
+        if options['dry_run']:
+            return
+
+        with suppress_notifications(), transaction.atomic():
+            created_episodes = Episode.objects.bulk_create(episodes, batch_size=options['batch_size'])
+            created_short_stories = ShortStory.objects.bulk_create(short_stories, batch_size=options['batch_size'])
+
+        # bulk_create skips the post_save receivers that keep story TOCs and the
+        # home snapshot fresh. The snapshot is rebuilt here rather than in the
+        # receivers' background thread, which would die with this process.
+        from stories.home_snapshot import rebuild_home_snapshot
+        from stories.toc import invalidate_story_toc
+        invalidate_story_toc(*{episode.story_id for episode in created_episodes})
+        rebuild_home_snapshot()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {len(created_episodes)} episodes and {len(created_short_stories)} short stories.'
+        ))
+
+        if not options['no_notify']:
+            from stories.telegram_notify import notify_bulk_import
+            notify_bulk_import(created_episodes, created_short_stories)
+
+    def _common_fields(self, record):
+        try:
+            published_date = parse_date(str(record.get('published_date', '')))
+        except ValueError:  # well formed but impossible, e.g. 2024-02-30
+            published_date = None
+        if published_date is None:
+            raise ValidationError('published_date must be a valid YYYY-MM-DD date')
+        return {
+            'title_dv': record.get('title_dv', ''),
+            'title_en': record.get('title_en', ''),
+            'content_dv': record.get('content_dv', ''),
+            'content_en': record.get('content_en', ''),
+            'published_date': published_date,
+            'author': self.authors(record.get('author')),
+        }
+
+    def _build_episode(self, record):
+        try:
+            episode_number = int(record.get('episode_number'))
+        except (TypeError, ValueError):
+            raise ValidationError('episode_number must be a whole number')
+        episode = Episode(
+            story=self.stories(record.get('story'), required=False),
+            episode_number=episode_number,
+            genre=self.genres(record.get('genre'), required=False),
+            **self._common_fields(record),
+        )
+        episode.clean_fields(exclude=['story', 'author', 'genre', *OPTIONAL_FIELDS])
+        return episode
+
+    def _build_short_story(self, record):
+        short_story = ShortStory(
+            genre=self.genres(record.get('genre'), required=False),
+            category=self.categories(record.get('category'), required=False),
+            is_featured=str(record.get('is_featured', False)).lower() in TRUE_VALUES,
+            is_published=str(record.get('is_published', True)).lower() in TRUE_VALUES,
+            **self._common_fields(record),
+        )
+        short_story.clean_fields(exclude=['author', 'genre', 'category', *OPTIONAL_FIELDS])
+        return short_story
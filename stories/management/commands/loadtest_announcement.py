@@ -0,0 +1,373 @@
+"""
+Load test replaying the burst after notify_new_episode posts to the channel:
+readers arrive at an accelerating rate on one episode page, then some of them
+toggle the language, react, comment and send the read-completion beacon.
+
+By default it starts its own gunicorn (gunicorn.conf.py, --workers processes)
+on a free local port against the configured database, so nothing external is
+needed. Use a scratch copy of the database: the run posts real reactions and
+comments (deleted afterwards, with the popularity rows rebuilt, unless
+--keep-data) and counts views.
+  manage.py loadtest_announcement
+  manage.py loadtest_announcement --readers 2000 --ramp 60 --concurrency 100
+  manage.py loadtest_announcement --url http://127.0.0.1:8000 --metrics-token ...
+
+Each virtual reader has its own cookies (csrftoken, lang) and X-Forwarded-For
+address, so CSRF and the per-IP rate limits behave as for real readers.
+Reports p50/p95/p99 latency and error rates per step, and database queries per
+URL name from /metrics (which needs METRICS_TOKEN; set automatically for the
+started server). Latencies are measured by the client and include its own
+overhead, so use them for before/after comparisons on the same machine.
+"""
+
+import http.client
+import json
+import os
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from stories.models import Comment, Episode, Reaction
+from vaahakainn import metrics
+
+USERNAME_PREFIX = 'loadtest-'
+STEPS = ('episode', 'toggle_language', 'reaction', 'comment', 'track')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def parse_metrics(text):
+    """{(name, labels): value} from Prometheus text format (counters only)."""
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        series, _, value = line.rpartition(' ')
+        name, _, labels = series.partition('{')
+        pairs = tuple(sorted(
+            tuple(pair.split('=', 1)) for pair in labels.rstrip('}').replace('"', '').split(',') if pair
+        ))
+        values[(name, pairs)] = float(value)
+    return values
+
+
+class Reader:
+    """One virtual reader: its own connection, cookies and client address."""
+
+    def __init__(self, number, target, host):
+        self.number = number
+        self.target = target
+        self.host = host
+        self.ip = f'10.{number // 65536 % 256}.{number // 256 % 256}.{number % 256}'
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        """Returns (status, seconds); raises OSError/HTTPException on connection errors."""
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.target.hostname, self.target.port, timeout=30)
+        request_headers = {
+            'Host': self.host,
+            # The server sits behind a TLS-terminating proxy in production.
+            'X-Forwarded-Proto': 'https',
+            'X-Forwarded-For': self.ip,
+            'User-Agent': f'loadtest-announcement/{self.number}',
+            'Accept-Encoding': 'br, gzip',
+        }
+        if self.cookies:
+            request_headers['Cookie'] = '; '.join(f'{key}={value}' for key, value in self.cookies.items())
+        request_headers.update(headers or {})
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=request_headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+        elapsed = time.perf_counter() - started
+        for header in response.msg.get_all('Set-Cookie') or ():
+            for key, morsel in SimpleCookie(header).items():
+                self.cookies[key] = morsel.value
+        if response.getheader('Connection', '').lower() == 'close':
+            self.close()
+        return response.status, elapsed
+
+    def post_json(self, path, data):
+        return self.request('POST', path, json.dumps(data), {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': self.cookies.get('csrftoken', ''),
+            'Origin': f'https://{self.host}',
+            'Referer': f'https://{self.host}/',
+        })
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Command(BaseCommand):
+    help = 'Replay a new-episode announcement spike against a local server and report latency, errors and queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Server to test (default: start gunicorn on a free local port)')
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn workers when starting the server')
+        parser.add_argument('--episode', type=int, help='Episode pk (default: the newest episode)')
+        parser.add_argument('--readers', type=int, default=500, help='Virtual readers arriving during the ramp')
+        parser.add_argument('--ramp', type=float, default=30, help='Seconds over which readers arrive')
+        parser.add_argument('--concurrency', type=int, default=50, help='Readers active at once')
+        parser.add_argument('--toggle-share', type=float, default=0.1, help='Share of readers switching language')
+        parser.add_argument('--react-share', type=float, default=0.3, help='Share of readers reacting')
+        parser.add_argument('--comment-share', type=float, default=0.05, help='Share of readers commenting')
+        parser.add_argument('--read-share', type=float, default=0.6, help='Share of readers finishing the chapter')
+        parser.add_argument('--metrics-token', default='', help='METRICS_TOKEN of a server given with --url')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the reader mix')
+        parser.add_argument('--keep-data', action='store_true', help='Keep the reactions and comments posted')
+
+    def handle(self, *args, **options):
+        episode = (
+            Episode.objects.filter(pk=options['episode']) if options['episode']
+            else Episode.objects.order_by('-published_date', '-pk')
+        ).first()
+        if episode is None:
+            raise CommandError('No episode to test; create one or pass --episode.')
+
+        self.host = options['host']
+        self.metrics_token = options['metrics_token']
+        server = None
+        if options['url']:
+            self.target = urlsplit(options['url'])
+        else:
+            server, self.target = self._start_server(options['workers'])
+        started_at = time.time()
+        try:
+            before = self._scrape_metrics()
+            results, wall = self._run(episode, options)
+            after = self._scrape_metrics()
+        finally:
+            if server is not None:
+                self._stop_server(server)
+            if not options['keep_data']:
+                self._clean_up(started_at)
+        if server is not None and before is not None:
+            # Workers write their final metrics when they exit, which a scrape can miss.
+            after = dict(metrics.collect(self.metrics_dir)[0])
+        if server is not None:
+            shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+        self._report(results, wall, options)
+        if before is not None and after is not None:
+            self._report_queries(before, after)
+        elif before is None:
+            self.stdout.write('\nNo query totals: /metrics needs --metrics-token (the server\'s METRICS_TOKEN).')
+
+    # Server ---------------------------------------------------------------
+
+    def _start_server(self, workers):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        self.metrics_token = secrets.token_urlsafe(16)
+        self.metrics_dir = tempfile.mkdtemp(prefix='loadtest-metrics-')
+        self.server_log = tempfile.NamedTemporaryFile(prefix='loadtest-gunicorn-', suffix='.log', delete=False)
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'vaahakainn.settings'),
+            ALLOWED_HOSTS=','.join({self.host, 'localhost', '127.0.0.1'}),
+            METRICS_TOKEN=self.metrics_token,
+            METRICS_DIR=self.metrics_dir,
+            METRICS_FLUSH_SECONDS='1',
+        )
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'vaahakainn.wsgi', '--config', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', '--workers', str(workers)],
+            cwd=settings.BASE_DIR, env=env, stdout=self.server_log, stderr=subprocess.STDOUT,
+        )
+        target = urlsplit(f'http://127.0.0.1:{port}')
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                break
+            probe = Reader(0, target, self.host)
+            try:
+                probe.request('GET', '/')
+                probe.close()
+                self.stdout.write(f'Started gunicorn with {workers} workers on port {port} (log: {self.server_log.name}).')
+                return server, target
+            except OSError:
+                time.sleep(0.2)
+        self._stop_server(server)
+        with open(self.server_log.name) as log:
+            raise CommandError(f'gunicorn did not start:\n{log.read()[-2000:]}')
+
+    def _stop_server(self, server):
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    def _scrape_metrics(self):
+        if not self.metrics_token:
+            return None
+        connection = http.client.HTTPConnection(self.target.hostname, self.target.port, timeout=30)
+        try:
+            connection.request('GET', '/metrics', headers={
+                'Host': self.host, 'X-Forwarded-Proto': 'https', 'Authorization': f'Bearer {self.metrics_token}',
+            })
+            response = connection.getresponse()
+            body = response.read().decode()
+        finally:
+            connection.close()
+        return parse_metrics(body) if response.status == 200 else None
+
+    def _clean_up(self, started_at):
+        from datetime import datetime, timezone as dt_timezone
+        from stories import popularity
+
+        since = datetime.fromtimestamp(started_at, dt_timezone.utc)
+        comments, _ = Comment.objects.filter(username__startswith=USERNAME_PREFIX, created_at__gte=since).delete()
+        reactions, _ = Reaction.objects.filter(username__startswith=USERNAME_PREFIX, created_at__gte=since).delete()
+        if comments or reactions:
+            popularity.rebuild()
+        self.stdout.write(f'Removed {reactions} test reactions and {comments} test comments.')
+
+    # Load -----------------------------------------------------------------
+
+    def _run(self, episode, options):
+        readers, ramp = options['readers'], options['ramp']
+        episode_path = f'/episodes/{episode.pk}/'
+        rng = random.Random(options['seed'])
+        # Arrivals accelerate linearly, as the announcement spreads: reader i starts at ramp * sqrt(i / n).
+        plans = [
+            {
+                'number': number,
+                'start': ramp * (number / readers) ** 0.5,
+                'toggle': rng.random() < options['toggle_share'],
+                'react': rng.random() < options['react_share'],
+                'comment': rng.random() < options['comment_share'],
+                'read': rng.random() < options['read_share'],
+            }
+            for number in range(1, readers + 1)
+        ]
+        results = defaultdict(list)  # step -> [(status or None, seconds)]
+        lock = threading.Lock()
+
+        def step(reader, name, call):
+            try:
+                status, seconds = call()
+            except (OSError, http.client.HTTPException):
+                status, seconds = None, 0.0
+            with lock:
+                results[name].append((status, seconds))
+            return status
+
+        def visit(plan):
+            delay = plan['start'] - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            reader = Reader(plan['number'], self.target, self.host)
+            try:
+                if step(reader, 'episode', lambda: reader.request('GET', episode_path)) != 200:
+                    return
+                if plan['toggle']:
+                    step(reader, 'toggle_language', lambda: reader.request(
+                        'GET', '/toggle-language/', headers={'Referer': f'https://{self.host}{episode_path}'}))
+                    step(reader, 'episode', lambda: reader.request('GET', episode_path))
+                username = f'{USERNAME_PREFIX}{plan["number"]}'
+                if plan['react']:
+                    step(reader, 'reaction', lambda: reader.post_json('/api/reactions/add/', {
+                        'content_type': 'episode', 'object_id': episode.pk,
+                        'reaction_type': 'heart', 'username': username,
+                    }))
+                if plan['comment']:
+                    step(reader, 'comment', lambda: reader.post_json('/api/comments/add/', {
+                        'content_type': 'episode', 'object_id': episode.pk,
+                        'username': username, 'comment': 'Load test comment, please ignore.',
+                    }))
+                if plan['read']:
+                    step(reader, 'track', lambda: reader.request(
+                        'POST', '/api/track/',
+                        urlencode({'content_type': 'episode', 'object_id': episode.pk, 'event': 'reads'}),
+                        {'Content-Type': 'application/x-www-form-urlencoded'}))
+            finally:
+                reader.close()
+
+        self.stdout.write(
+            f'Replaying {readers} readers over {ramp:g}s on {episode_path} '
+            f'({options["concurrency"]} at a time)...'
+        )
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(visit, plans))
+        return results, time.perf_counter() - started
+
+    # Report ---------------------------------------------------------------
+
+    def _report(self, results, wall, options):
+        total = sum(len(samples) for samples in results.values())
+        self.stdout.write(f'\n{total} requests in {wall:.1f}s ({total / wall:.1f} req/s)\n')
+        self.stdout.write(
+            f'{"step":<16} {"requests":>8} {"errors":>7} {"429":>5} {"4xx":>5} '
+            f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}'
+        )
+        failed = 0
+        for name in STEPS:
+            samples = results.get(name)
+            if not samples:
+                continue
+            errors = sum(1 for status, _ in samples if status is None or status >= 500)
+            limited = sum(1 for status, _ in samples if status == 429)
+            client_errors = sum(1 for status, _ in samples if status and 400 <= status < 500 and status != 429)
+            failed += errors
+            latencies = sorted(seconds * 1000 for status, seconds in samples if status is not None)
+            self.stdout.write(
+                f'{name:<16} {len(samples):>8} {errors / len(samples):>7.1%} {limited:>5} {client_errors:>5} '
+                f'{percentile(latencies, 0.50):>8.1f} {percentile(latencies, 0.95):>8.1f} '
+                f'{percentile(latencies, 0.99):>8.1f} {(latencies[-1] if latencies else 0):>8.1f}'
+            )
+        style = self.style.ERROR if failed else self.style.SUCCESS
+        self.stdout.write(style(f'\n{failed} failed requests (5xx or connection errors).'))
+
+    def _report_queries(self, before, after):
+        queries, requests = defaultdict(float), defaultdict(float)
+        for (name, labels), value in after.items():
+            delta = value - before.get((name, labels), 0)
+            view = dict(labels).get('view')
+            if name == 'db_queries_total':
+                queries[view] += delta
+            elif name == 'http_requests_total' and view != 'metrics':
+                requests[view] += delta
+        if not any(queries.values()):
+            return
+        self.stdout.write(f'\n{"view":<20} {"requests":>9} {"queries":>9} {"per request":>12}')
+        for view, count in sorted(queries.items(), key=lambda item: -item[1]):
+            if view == 'metrics' or not count:
+                continue
+            served = requests.get(view, 0)
+            self.stdout.write(
+                f'{view:<20} {served:>9.0f} {count:>9.0f} {(count / served if served else 0):>12.1f}'
+            )
+        self.stdout.write(f'{"total":<20} {sum(requests.values()):>9.0f} '
+                          f'{sum(q for v, q in queries.items() if v != "metrics"):>9.0f}')
@@ -0,0 +1,37 @@
+"""
+Fill in the size and blurred placeholder of cover and profile images saved
+before stories/image_placeholders.py existed (new uploads are processed in the
+background automatically):
+  manage.py process_images
+  manage.py process_images --all     # redo every image, e.g. after changing PLACEHOLDER_WIDTH
+"""
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from stories import image_placeholders
+
+
+class Command(BaseCommand):
+    help = 'Store intrinsic sizes and blurred placeholders for cover and profile images that lack them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess images that already have details')
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        for label, field in image_placeholders.IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            rows = model._default_manager.exclude(Q(**{f'{field}__isnull': True}) | Q(**{field: ''}))
+            if not options['all']:
+                rows = rows.filter(**{f'{field}_placeholder': ''})
+            for pk in rows.values_list('pk', flat=True).iterator():
+                try:
+                    if image_placeholders.process(model, pk):
+                        processed += 1
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'{label} #{pk}: {exc}')
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(f'Processed {processed} images, {failed} failed.'))
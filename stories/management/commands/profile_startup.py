@@ -0,0 +1,85 @@
+"""
+Import-time profile of a cold start, in the spirit of `python -X importtime`.
+
+Starts a fresh interpreter that does what a gunicorn worker does before its
+first request (import vaahakainn.wsgi, which runs django.setup(), then load the
+URLconf) and reports where the time went:
+  manage.py profile_startup
+  manage.py profile_startup --top 40 --by module
+  manage.py profile_startup --warm-up     # include vaahakainn.warmup.warm_up()
+"""
+
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+STARTUP_SCRIPT = """
+import vaahakainn.wsgi
+from django.urls import get_resolver
+get_resolver()._populate()
+"""
+WARM_UP_SCRIPT = """
+from vaahakainn.warmup import warm_up
+warm_up()
+"""
+
+
+def parse_importtime(lines):
+    """(module, self_us, cumulative_us, depth) rows from -X importtime output."""
+    rows = []
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Profile the imports a cold start performs and report the slowest modules and packages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Rows to show')
+        parser.add_argument('--by', choices=('package', 'module'), default='package',
+                            help='Group self time by top-level package, or list modules by cumulative time')
+        parser.add_argument('--warm-up', action='store_true', help='Also run the gunicorn preload warm-up')
+
+    def handle(self, *args, **options):
+        script = STARTUP_SCRIPT + (WARM_UP_SCRIPT if options['warm_up'] else '')
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'vaahakainn.settings'))
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        wall = time.perf_counter() - started
+        if result.returncode:
+            raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+
+        rows = parse_importtime(result.stderr.splitlines())
+        total_us = sum(self_us for _, self_us, _, _ in rows)
+        self.stdout.write(
+            f'Cold start: {wall * 1000:.0f} ms wall clock, {total_us / 1000:.0f} ms importing '
+            f'{len(rows)} modules.'
+        )
+
+        if options['by'] == 'module':
+            self.stdout.write(f'\n{"cumulative ms":>14} {"self ms":>9}  module')
+            for name, self_us, cumulative_us, depth in sorted(rows, key=lambda r: -r[2])[:options['top']]:
+                self.stdout.write(f'{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {"  " * depth}{name}')
+            return
+
+        packages = defaultdict(lambda: [0, 0])
+        for name, self_us, _, _ in rows:
+            package = packages[name.split('.')[0]]
+            package[0] += self_us
+            package[1] += 1
+        self.stdout.write(f'\n{"self ms":>9} {"share":>6} {"modules":>8}  package')
+        for name, (self_us, count) in sorted(packages.items(), key=lambda item: -item[1][0])[:options['top']]:
+            self.stdout.write(f'{self_us / 1000:>9.1f} {self_us / total_us:>6.1%} {count:>8}  {name}')
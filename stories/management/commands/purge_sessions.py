@@ -0,0 +1,55 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete leftover rows from the django_session table: expired sessions and '
+        'anonymous sessions (no logged-in user). Use --all once SESSION_BACKEND no '
+        'longer points at the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Delete every session row, including logged-in ones')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per DELETE statement')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        if options['all']:
+            total = Session.objects.count()
+            if not dry_run:
+                Session.objects.all().delete()
+            self.stdout.write(f'{"Would delete" if dry_run else "Deleted"} {total} session rows.')
+            return
+
+        expired = Session.objects.filter(expire_date__lt=timezone.now())
+        expired_count = expired.count()
+        if not dry_run:
+            expired.delete()
+
+        # Anonymous sessions can only be told apart by decoding session_data, so
+        # stream the live rows and delete the anonymous ones in batches.
+        anonymous_count = 0
+        batch = []
+        live = Session.objects.filter(expire_date__gte=timezone.now()).only('session_key', 'session_data')
+        for session in live.iterator(chunk_size=batch_size):
+            if '_auth_user_id' in session.get_decoded():
+                continue
+            batch.append(session.session_key)
+            if len(batch) >= batch_size:
+                anonymous_count += self._delete(batch, dry_run)
+                batch = []
+        if batch:
+            anonymous_count += self._delete(batch, dry_run)
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(f'{verb} {expired_count} expired and {anonymous_count} anonymous session rows.')
+
+    def _delete(self, keys, dry_run):
+        if not dry_run:
+            Session.objects.filter(session_key__in=keys).delete()
+        return len(keys)
@@ -0,0 +1,38 @@
+"""
+Compact reactions older than REACTION_ROLLUP_AFTER_DAYS into daily aggregates
+(stories/reaction_rollups.py). Safe to run repeatedly, e.g. nightly:
+  manage.py rollup_reactions
+  manage.py rollup_reactions --older-than-days 90 --dry-run
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from stories import reaction_rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold old Reaction rows into per-object, per-type, per-day rollups and drop the raw rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int,
+                            help='Compact reactions older than this many days (default: REACTION_ROLLUP_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=reaction_rollups.BATCH_SIZE,
+                            help='Reactions compacted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many reactions would be compacted')
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] is not None:
+            if options['older_than_days'] < 1:
+                raise CommandError('--older-than-days must be at least 1')
+            before = timezone.now() - timedelta(days=options['older_than_days'])
+        else:
+            before = reaction_rollups.rollup_cutoff()
+
+        compacted, rollups = reaction_rollups.compact(before, options['batch_size'], options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f'Would compact {compacted} reactions created before {before:%Y-%m-%d %H:%M}.')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Compacted {compacted} reactions into {rollups} daily rollup updates.'))
@@ -0,0 +1,28 @@
+"""
+Periodic maintenance for the trending/most-loved rankings (stories/popularity.py).
+
+Run hourly to decay trending scores, and nightly with --rebuild to recompute
+every score from the Reaction and Comment tables:
+  manage.py update_popularity
+  manage.py update_popularity --rebuild
+"""
+
+from django.core.management.base import BaseCommand
+
+from stories import popularity
+
+
+class Command(BaseCommand):
+    help = 'Decay trending scores, or rebuild all popularity rows from reactions and comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every score from the raw rows instead of only decaying')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            count = popularity.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt popularity for {count} objects.'))
+        else:
+            count = popularity.decay()
+            self.stdout.write(self.style.SUCCESS(f'Decayed {count} trending scores.'))
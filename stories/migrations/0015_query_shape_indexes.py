@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('stories', '0014_episode_story_fk'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_approved', True)), fields=['content_type', 'object_id', '-created_at'], name='comment_approved_target_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='episode',
+            index=models.Index(fields=['story', 'episode_number'], name='episode_story_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='episode',
+            index=models.Index(fields=['-published_date'], name='episode_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shortstory',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-published_date'], name='shortstory_published_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shortstory',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['category', '-published_date'], name='shortstory_category_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shortstory',
+            index=models.Index(condition=models.Q(('is_featured', True), ('is_published', True)), fields=['-published_date'], name='shortstory_featured_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['-release_date'], name='story_release_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['category', '-release_date'], name='story_category_release_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(condition=models.Q(('is_featured', True)), fields=['-release_date'], name='story_featured_release_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('stories', '0016_comment_moderation_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Popularity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('reactions', models.PositiveIntegerField(default=0)),
+                ('hearts', models.PositiveIntegerField(default=0)),
+                ('comments', models.PositiveIntegerField(default=0)),
+                ('trending', models.FloatField(default=0, help_text='Time-decayed engagement score')),
+                ('decayed_at', models.DateTimeField(help_text='When the trending score was last decayed')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name_plural': 'Popularity',
+                'indexes': [models.Index(fields=['content_type', '-trending'], name='popularity_trending_idx'), models.Index(fields=['content_type', '-hearts'], name='popularity_hearts_idx')],
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id'), name='popularity_target_uniq')],
+            },
+        ),
+    ]
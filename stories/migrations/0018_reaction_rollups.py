@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('stories', '0017_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReactionFingerprint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('reaction_type', models.CharField(choices=[('heart', '❤️ Heart'), ('like', '👍 Like'), ('love', '😍 Love'), ('laugh', '😂 Laugh'), ('wow', '😮 Wow')], max_length=10)),
+                ('fingerprint', models.BigIntegerField()),
+                ('day', models.DateField(help_text='Rollup day this reaction was counted in')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id', 'reaction_type', 'fingerprint'), name='reaction_fingerprint_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReactionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('reaction_type', models.CharField(choices=[('heart', '❤️ Heart'), ('like', '👍 Like'), ('love', '😍 Love'), ('laugh', '😂 Laugh'), ('wow', '😮 Wow')], max_length=10)),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id', 'reaction_type', 'day'), name='reaction_rollup_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 16:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('stories', '0018_reaction_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyViews',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('day', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('reads', models.PositiveIntegerField(default=0, help_text='Readers who reached the end of the text')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily views',
+                'constraints': [models.UniqueConstraint(fields=('content_type', 'object_id', 'day'), name='dailyviews_target_day_uniq')],
+            },
+        ),
+    ]
@@ -1,9 +1,12 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.core.validators import MinLengthValidator
-from django.db.models.signals import pre_save, post_save
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from cloudinary.models import CloudinaryField
 
@@ -26,6 +29,10 @@ class Author(models.Model):
 	name = models.CharField(max_length=100)
 	bio = models.TextField(blank=True)
 	profile_image = CloudinaryField('image', blank=True, null=True)
+	# Filled in after upload (image_placeholders.py)
+	profile_image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+	profile_image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+	profile_image_placeholder = models.TextField(blank=True, editable=False)
 	website = models.URLField(blank=True)
 
 	def __str__(self):
@@ -39,6 +46,14 @@ class Genre(models.Model):
 	def __str__(self):
 		return self.name
 
+class EpisodeQuerySet(models.QuerySet):
+	# Chapter bodies: by far the largest columns, only needed on detail pages.
+	BODY_FIELDS = ('content_dv', 'content_en')
+
+	def for_listing(self):
+		"""Everything a list row or card needs, without the chapter bodies."""
+		return self.defer(*self.BODY_FIELDS)
+
 class Episode(models.Model):
 	story = models.ForeignKey('Story', on_delete=models.CASCADE, related_name='episodes', null=True, blank=True)
 	episode_number = models.PositiveIntegerField()
@@ -50,6 +65,16 @@ class Episode(models.Model):
 	author = models.ForeignKey(Author, on_delete=models.CASCADE)
 	genre = models.ForeignKey(Genre, on_delete=models.SET_NULL, null=True)
 
+	objects = EpisodeQuerySet.as_manager()
+
+	class Meta:
+		indexes = [
+			# story_detail / episode_detail neighbours: story episodes by number
+			models.Index(fields=['story', 'episode_number'], name='episode_story_number_idx'),
+			# home: latest episodes
+			models.Index(fields=['-published_date'], name='episode_published_idx'),
+		]
+
 	def __str__(self):
 		return f"Episode {self.episode_number}: {self.title_en}"
 
@@ -61,15 +86,21 @@ class Episode(models.Model):
 
 	@property
 	def total_reactions(self):
-		from django.contrib.contenttypes.models import ContentType
-		ct = ContentType.objects.get_for_model(self)
-		return Reaction.objects.filter(content_type=ct, object_id=self.id).count()
+		return reaction_count(self)
 
 	@property
 	def heart_reactions(self):
-		from django.contrib.contenttypes.models import ContentType
-		ct = ContentType.objects.get_for_model(self)
-		return Reaction.objects.filter(content_type=ct, object_id=self.id, reaction_type='heart').count()
+		return reaction_count(self, 'heart')
+
+class StoryQuerySet(models.QuerySet):
+	def with_episode_count(self):
+		"""Annotate episode_count with a correlated subquery rather than a
+		GROUP BY, so "latest stories" can still walk the release_date indexes."""
+		episodes = (
+			Episode.objects.filter(story=models.OuterRef('pk')).order_by()
+			.values('story').annotate(count=models.Count('pk')).values('count')
+		)
+		return self.annotate(episode_count=Coalesce(models.Subquery(episodes), 0))
 
 class Story(models.Model):
 	STATUS_CHOICES = [
@@ -88,11 +119,25 @@ class Story(models.Model):
 	description_en = models.TextField(blank=True, help_text='Description in English')
 	
 	cover_image = CloudinaryField('image', blank=True, null=True)
+	# Filled in after upload (image_placeholders.py)
+	cover_image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+	cover_image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+	cover_image_placeholder = models.TextField(blank=True, editable=False)
 	release_date = models.DateField()
 	category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='stories')
 	is_featured = models.BooleanField(default=False, help_text='Feature this story on homepage')
 	status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ongoing', help_text='Story completion status')
 
+	objects = StoryQuerySet.as_manager()
+
+	class Meta:
+		indexes = [
+			# home / story_list: latest stories, optionally within a category
+			models.Index(fields=['-release_date'], name='story_release_idx'),
+			models.Index(fields=['category', '-release_date'], name='story_category_release_idx'),
+			models.Index(fields=['-release_date'], condition=models.Q(is_featured=True), name='story_featured_release_idx'),
+		]
+
 	def __str__(self):
 		return self.title_dv or self.title_en or self.title or f"Story #{self.id}"
 
@@ -104,15 +149,11 @@ class Story(models.Model):
 
 	@property
 	def total_reactions(self):
-		from django.contrib.contenttypes.models import ContentType
-		ct = ContentType.objects.get_for_model(self)
-		return Reaction.objects.filter(content_type=ct, object_id=self.id).count()
+		return reaction_count(self)
 
 	@property
 	def heart_reactions(self):
-		from django.contrib.contenttypes.models import ContentType
-		ct = ContentType.objects.get_for_model(self)
-		return Reaction.objects.filter(content_type=ct, object_id=self.id, reaction_type='heart').count()
+		return reaction_count(self, 'heart')
 
 class Comment(models.Model):
 	# Generic relation to allow comments on both stories and episodes
@@ -141,6 +182,15 @@ class Comment(models.Model):
 		indexes = [
 			models.Index(fields=['content_type', 'object_id']),
 			models.Index(fields=['created_at']),
+			# Detail pages: approved comments for one object, newest first
+			models.Index(
+				fields=['content_type', 'object_id', '-created_at'],
+				condition=models.Q(is_approved=True),
+				name='comment_approved_target_idx',
+			),
+			# Moderation queue: pending comments and per-IP filtering
+			models.Index(fields=['-created_at', '-id'], condition=models.Q(is_approved=False), name='comment_pending_idx'),
+			models.Index(fields=['ip_address', '-created_at'], name='comment_ip_idx'),
 		]
 
 	def __str__(self):
@@ -154,15 +204,11 @@ class Comment(models.Model):
 
 	@property
 	def total_reactions(self):
-		from django.contrib.contenttypes.models import ContentType
-		ct = ContentType.objects.get_for_model(self)
-		return Reaction.objects.filter(content_type=ct, object_id=self.id).count()
+		return reaction_count(self)
 
 	@property
 	def heart_reactions(self):
-		from django.contrib.contenttypes.models import ContentType
-		ct = ContentType.objects.get_for_model(self)
-		return Reaction.objects.filter(content_type=ct, object_id=self.id, reaction_type='heart').count()
+		return reaction_count(self, 'heart')
 
 class Reaction(models.Model):
 	REACTION_CHOICES = [
@@ -207,6 +253,68 @@ class Reaction(models.Model):
 			return f'{self.get_reaction_type_display()}{username_part} (ID: {self.id})'
 
 
+class ReactionRollup(models.Model):
+	"""
+	Reactions older than REACTION_ROLLUP_AFTER_DAYS, compacted into one row per
+	object, reaction type and day (manage.py rollup_reactions).
+	"""
+	content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+	object_id = models.PositiveIntegerField()
+	content_object = GenericForeignKey('content_type', 'object_id')
+	reaction_type = models.CharField(max_length=10, choices=Reaction.REACTION_CHOICES)
+	day = models.DateField()
+	count = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['content_type', 'object_id', 'reaction_type', 'day'], name='reaction_rollup_uniq'),
+		]
+
+	def __str__(self):
+		return f'{self.count} × {self.reaction_type} on {self.content_type.model} #{self.object_id} ({self.day})'
+
+
+class ReactionFingerprint(models.Model):
+	"""
+	What remains of a compacted Reaction for duplicate prevention: a keyed hash
+	of the IP address instead of the address, user agent and username.
+	"""
+	content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+	object_id = models.PositiveIntegerField()
+	reaction_type = models.CharField(max_length=10, choices=Reaction.REACTION_CHOICES)
+	fingerprint = models.BigIntegerField()
+	day = models.DateField(help_text='Rollup day this reaction was counted in')
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(
+				fields=['content_type', 'object_id', 'reaction_type', 'fingerprint'], name='reaction_fingerprint_uniq',
+			),
+		]
+
+
+def reaction_querysets(content_type, object_id, reaction_type=None):
+	"""(recent Reaction rows, compacted ReactionRollup rows) on one object."""
+	filters = {'content_type': content_type, 'object_id': object_id}
+	if reaction_type:
+		filters['reaction_type'] = reaction_type
+	return Reaction.objects.filter(**filters), ReactionRollup.objects.filter(**filters)
+
+
+def reaction_count(obj, reaction_type=None):
+	"""Reactions on `obj`: the recent Reaction rows plus the compacted daily rollups."""
+	recent, rollups = reaction_querysets(ContentType.objects.get_for_model(obj), obj.pk, reaction_type)
+	return recent.count() + (rollups.aggregate(n=models.Sum('count'))['n'] or 0)
+
+
+class ShortStoryQuerySet(models.QuerySet):
+	BODY_FIELDS = ('content_dv', 'content_en')
+
+	def for_listing(self):
+		"""Everything a list row or card needs, without the story bodies."""
+		return self.defer(*self.BODY_FIELDS)
+
+
 class ShortStory(models.Model):
 	title_dv = models.CharField(max_length=200, help_text='Title in Dhivehi')
 	title_en = models.CharField(max_length=200, help_text='Title in English')
@@ -216,12 +324,18 @@ class ShortStory(models.Model):
 	content_dv = models.TextField(help_text='Story content in Dhivehi')
 	content_en = models.TextField(help_text='Story content in English')
 	cover_image = CloudinaryField('image', blank=True, null=True)
+	# Filled in after upload (image_placeholders.py)
+	cover_image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+	cover_image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+	cover_image_placeholder = models.TextField(blank=True, editable=False)
 	published_date = models.DateField()
 	is_featured = models.BooleanField(default=False, help_text='Feature this story on homepage')
 	is_published = models.BooleanField(default=True, help_text='Published status')
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
+	objects = ShortStoryQuerySet.as_manager()
+
 	class Meta:
 		verbose_name = "Short Story"
 		verbose_name_plural = "Short Stories"
@@ -229,6 +343,18 @@ class ShortStory(models.Model):
 		indexes = [
 			models.Index(fields=['published_date']),
 			models.Index(fields=['is_published', 'is_featured']),
+			# short_story_list (optionally by category) and home's featured row
+			models.Index(fields=['-published_date'], condition=models.Q(is_published=True), name='shortstory_published_idx'),
+			models.Index(
+				fields=['category', '-published_date'],
+				condition=models.Q(is_published=True),
+				name='shortstory_category_pub_idx',
+			),
+			models.Index(
+				fields=['-published_date'],
+				condition=models.Q(is_published=True, is_featured=True),
+				name='shortstory_featured_idx',
+			),
 		]
 
 	def __str__(self):
@@ -242,15 +368,65 @@ class ShortStory(models.Model):
 
 	@property
 	def total_reactions(self):
-		from django.contrib.contenttypes.models import ContentType
-		ct = ContentType.objects.get_for_model(self)
-		return Reaction.objects.filter(content_type=ct, object_id=self.id).count()
+		return reaction_count(self)
 
 	@property
 	def heart_reactions(self):
-		from django.contrib.contenttypes.models import ContentType
-		ct = ContentType.objects.get_for_model(self)
-		return Reaction.objects.filter(content_type=ct, object_id=self.id, reaction_type='heart').count()
+		return reaction_count(self, 'heart')
+
+
+class Popularity(models.Model):
+	"""
+	Running engagement totals for one Story, Episode or ShortStory, maintained
+	incrementally as reactions and comments arrive (see popularity.py), so the
+	trending and most-loved lists are a single indexed read.
+	"""
+	content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+	object_id = models.PositiveIntegerField()
+	content_object = GenericForeignKey('content_type', 'object_id')
+
+	reactions = models.PositiveIntegerField(default=0)
+	hearts = models.PositiveIntegerField(default=0)
+	comments = models.PositiveIntegerField(default=0)
+	trending = models.FloatField(default=0, help_text='Time-decayed engagement score')
+	decayed_at = models.DateTimeField(help_text='When the trending score was last decayed')
+
+	class Meta:
+		verbose_name_plural = "Popularity"
+		constraints = [
+			models.UniqueConstraint(fields=['content_type', 'object_id'], name='popularity_target_uniq'),
+		]
+		indexes = [
+			# Trending / most-loved lists per model
+			models.Index(fields=['content_type', '-trending'], name='popularity_trending_idx'),
+			models.Index(fields=['content_type', '-hearts'], name='popularity_hearts_idx'),
+		]
+
+	def __str__(self):
+		return f'Popularity of {self.content_type.model} #{self.object_id}'
+
+
+class DailyViews(models.Model):
+	"""
+	Page views and read completions per Story, Episode or ShortStory per day.
+	Written in batches from each worker's in-memory buffer (view_counts.py),
+	never from the request that is being counted.
+	"""
+	content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+	object_id = models.PositiveIntegerField()
+	content_object = GenericForeignKey('content_type', 'object_id')
+	day = models.DateField()
+	views = models.PositiveIntegerField(default=0)
+	reads = models.PositiveIntegerField(default=0, help_text='Readers who reached the end of the text')
+
+	class Meta:
+		verbose_name_plural = "Daily views"
+		constraints = [
+			models.UniqueConstraint(fields=['content_type', 'object_id', 'day'], name='dailyviews_target_day_uniq'),
+		]
+
+	def __str__(self):
+		return f'{self.views} views of {self.content_type.model} #{self.object_id} on {self.day}'
 
 
 @receiver(pre_save, sender=Story)
@@ -260,9 +436,54 @@ def update_legacy_fields(sender, instance, **kwargs):
 	instance.description = instance.description_dv or instance.description_en or instance.description
 
 
+@receiver(pre_save, sender=Story)
+@receiver(pre_save, sender=ShortStory)
+@receiver(pre_save, sender=Author)
+def reset_image_details(sender, instance, update_fields=None, **kwargs):
+	"""A new cover/profile image invalidates its stored size and placeholder."""
+	from .image_placeholders import cleared_details, image_field, image_key
+
+	field = image_field(sender)
+	if update_fields is not None and field not in update_fields:
+		return
+	previous = None
+	if instance.pk and not instance._state.adding:
+		previous = sender._default_manager.filter(pk=instance.pk).values_list(field, flat=True).first()
+	instance._image_changed = image_key(getattr(instance, field)) != image_key(previous)
+	if instance._image_changed:
+		for name, value in cleared_details(field).items():
+			setattr(instance, name, value)
+
+
+@receiver(post_save, sender=Story)
+@receiver(post_save, sender=ShortStory)
+@receiver(post_save, sender=Author)
+def process_new_image(sender, instance, **kwargs):
+	from .image_placeholders import image_field, schedule
+
+	if getattr(instance, '_image_changed', False) and getattr(instance, image_field(sender)):
+		instance._image_changed = False
+		schedule(instance)
+
+
+# Set while bulk operations run (e.g. import_episodes), which send one aggregated
+# notification themselves instead of one channel post per row.
+_notifications_suppressed = ContextVar('notifications_suppressed', default=False)
+
+
+@contextmanager
+def suppress_notifications():
+	"""Silence the per-row Telegram notifications for saves inside this block."""
+	token = _notifications_suppressed.set(True)
+	try:
+		yield
+	finally:
+		_notifications_suppressed.reset(token)
+
+
 @receiver(post_save, sender=Episode)
 def notify_episode_created(sender, instance, created, **kwargs):
-	if not created:
+	if not created or _notifications_suppressed.get():
 		return
 	from .telegram_notify import notify_new_episode
 	notify_new_episode(instance)
@@ -270,7 +491,7 @@ def notify_episode_created(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=Story)
 def notify_story_created(sender, instance, created, **kwargs):
-	if not created:
+	if not created or _notifications_suppressed.get():
 		return
 	from .telegram_notify import notify_new_story
 	notify_new_story(instance)
@@ -278,7 +499,64 @@ def notify_story_created(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=ShortStory)
 def notify_short_story_created(sender, instance, created, **kwargs):
-	if not created:
+	if not created or _notifications_suppressed.get():
 		return
 	from .telegram_notify import notify_new_short_story
 	notify_new_short_story(instance)
+
+
+@receiver(pre_save, sender=Episode)
+def remember_previous_story(sender, instance, **kwargs):
+	# An episode moved to another story must also leave the old story's TOC.
+	if instance.pk and not instance._state.adding:
+		instance._previous_story_id = (
+			Episode.objects.filter(pk=instance.pk).values_list('story_id', flat=True).first()
+		)
+
+
+@receiver(post_save, sender=Episode)
+@receiver(post_delete, sender=Episode)
+def invalidate_episode_toc(sender, instance, **kwargs):
+	from .toc import invalidate_story_toc
+	# After the commit: a reader arriving in between would otherwise re-cache
+	# the old TOC for the full STORY_TOC_CACHE_SECONDS.
+	story_ids = (instance.story_id, getattr(instance, '_previous_story_id', None))
+	transaction.on_commit(lambda: invalidate_story_toc(*story_ids))
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Genre)
+def invalidate_tocs_for_names(sender, instance, created, **kwargs):
+	if created:
+		return
+	from .toc import invalidate_all_tocs
+	transaction.on_commit(invalidate_all_tocs)
+
+
+@receiver(post_save, sender=Story)
+@receiver(post_delete, sender=Story)
+@receiver(post_save, sender=Episode)
+@receiver(post_delete, sender=Episode)
+@receiver(post_save, sender=ShortStory)
+@receiver(post_delete, sender=ShortStory)
+def refresh_home_snapshot(sender, instance, **kwargs):
+	from .home_snapshot import schedule_home_snapshot_rebuild
+	schedule_home_snapshot_rebuild()
+
+
+# Popularity only counts additions here: a post_delete receiver on Reaction or
+# Comment would stop Django from deleting them with a single DELETE (moderation
+# bulk deletes). add_reaction records its toggle-off itself, and the periodic
+# update_popularity --rebuild corrects anything else.
+@receiver(post_save, sender=Reaction)
+def record_reaction_popularity(sender, instance, created, **kwargs):
+	if created:
+		from .popularity import record_reaction
+		record_reaction(instance)
+
+
+@receiver(post_save, sender=Comment)
+def record_comment_popularity(sender, instance, created, **kwargs):
+	if created and instance.is_approved:
+		from .popularity import record_comment
+		record_comment(instance)
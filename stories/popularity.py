@@ -0,0 +1,177 @@
+"""
+Trending and most-loved rankings for stories, episodes and short stories.
+
+Each reaction or approved comment adds to the target's Popularity row with one
+UPDATE (receivers in models.py); engagement with an episode also counts towards
+its story. `trending` is a time-decayed score: update_popularity (run it hourly)
+multiplies every score by 0.5 ** (hours since the last decay / half-life), so
+what readers engaged with this week outranks all-time favourites.
+update_popularity --rebuild recomputes everything from the raw rows and the
+reaction rollups, which corrects removed reactions, moderated comments and
+deleted content.
+
+Ranked lists are a single indexed read of Popularity:
+  trending(Story, 5)    most_loved(ShortStory, 10)
+"""
+
+from datetime import datetime, time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+REACTION_WEIGHT = 1.0
+COMMENT_WEIGHT = 3.0
+BATCH_SIZE = 500
+
+
+def _half_life_hours():
+	return getattr(settings, 'POPULARITY_HALF_LIFE_HOURS', 72)
+
+
+def _decay_factor(since, now):
+	hours = max((now - since).total_seconds() / 3600, 0)
+	return 0.5 ** (hours / _half_life_hours())
+
+
+def _content_types():
+	from .models import Episode, ShortStory, Story
+	return ContentType.objects.get_for_models(Story, Episode, ShortStory)
+
+
+def _targets(content_type_id, object_id):
+	"""The (content_type_id, object_id) pairs credited for engagement with one object."""
+	from .models import Episode, Story
+	types = _content_types()
+	if content_type_id not in {ct.pk for ct in types.values()}:
+		return []  # e.g. reactions on comments
+	targets = [(content_type_id, object_id)]
+	if content_type_id == types[Episode].pk:
+		story_id = Episode.objects.filter(pk=object_id).values_list('story_id', flat=True).first()
+		if story_id:
+			targets.append((types[Story].pk, story_id))
+	return targets
+
+
+def _bump(content_type_id, object_id, sign=1, **amounts):
+	"""Add (or with sign=-1, subtract) `amounts` to one Popularity row, creating it if needed."""
+	from .models import Popularity
+
+	rows = Popularity.objects.filter(content_type_id=content_type_id, object_id=object_id)
+	if sign > 0:
+		changes = {field: F(field) + amount for field, amount in amounts.items() if amount}
+	else:
+		changes = {field: Greatest(F(field) - amount, Value(0)) for field, amount in amounts.items() if amount}
+	if rows.update(**changes) or sign < 0:
+		return
+	try:
+		with transaction.atomic():
+			Popularity.objects.create(
+				content_type_id=content_type_id, object_id=object_id, decayed_at=timezone.now(), **amounts,
+			)
+	except IntegrityError:
+		rows.update(**changes)  # created concurrently
+
+
+def record_reaction(reaction, sign=1):
+	hearts = 1 if reaction.reaction_type == 'heart' else 0
+	for content_type_id, object_id in _targets(reaction.content_type_id, reaction.object_id):
+		_bump(content_type_id, object_id, sign, reactions=1, hearts=hearts, trending=REACTION_WEIGHT)
+
+
+def record_comment(comment, sign=1):
+	for content_type_id, object_id in _targets(comment.content_type_id, comment.object_id):
+		_bump(content_type_id, object_id, sign, comments=1, trending=COMMENT_WEIGHT)
+
+
+def decay(now=None):
+	"""Apply time decay to every trending score; one UPDATE per distinct decayed_at."""
+	from .models import Popularity
+
+	now = now or timezone.now()
+	updated = 0
+	for since in Popularity.objects.filter(decayed_at__lt=now).values_list('decayed_at', flat=True).distinct():
+		updated += Popularity.objects.filter(decayed_at=since).update(
+			trending=F('trending') * _decay_factor(since, now), decayed_at=now,
+		)
+	return updated
+
+
+def rebuild(now=None):
+	"""Recompute every Popularity row from reactions (raw and rolled up) and comments."""
+	from .models import Comment, Episode, Popularity, Reaction, ReactionRollup, Story
+
+	now = now or timezone.now()
+	types = _content_types()
+	type_ids = [ct.pk for ct in types.values()]
+	story_of = dict(Episode.objects.exclude(story=None).values_list('pk', 'story_id').iterator())
+	episode_type, story_type = types[Episode].pk, types[Story].pk
+
+	totals = {}
+
+	def add(content_type_id, object_id, created_at, weight, **counts):
+		keys = [(content_type_id, object_id)]
+		if content_type_id == episode_type and object_id in story_of:
+			keys.append((story_type, story_of[object_id]))
+		score = weight * _decay_factor(created_at, now)
+		for key in keys:
+			row = totals.setdefault(key, {'reactions': 0, 'hearts': 0, 'comments': 0, 'trending': 0.0})
+			row['trending'] += score
+			for field, amount in counts.items():
+				row[field] += amount
+
+	reactions = Reaction.objects.filter(content_type_id__in=type_ids).values_list(
+		'content_type_id', 'object_id', 'reaction_type', 'created_at',
+	)
+	for content_type_id, object_id, reaction_type, created_at in reactions.iterator(chunk_size=BATCH_SIZE):
+		add(content_type_id, object_id, created_at, REACTION_WEIGHT, reactions=1, hearts=int(reaction_type == 'heart'))
+
+	rollups = ReactionRollup.objects.filter(content_type_id__in=type_ids).values_list(
+		'content_type_id', 'object_id', 'reaction_type', 'day', 'count',
+	)
+	for content_type_id, object_id, reaction_type, day, count in rollups.iterator(chunk_size=BATCH_SIZE):
+		created_at = timezone.make_aware(datetime.combine(day, time(12)))
+		add(content_type_id, object_id, created_at, REACTION_WEIGHT * count,
+			reactions=count, hearts=count if reaction_type == 'heart' else 0)
+
+	comments = Comment.objects.filter(content_type_id__in=type_ids, is_approved=True).values_list(
+		'content_type_id', 'object_id', 'created_at',
+	)
+	for content_type_id, object_id, created_at in comments.iterator(chunk_size=BATCH_SIZE):
+		add(content_type_id, object_id, created_at, COMMENT_WEIGHT, comments=1)
+
+	with transaction.atomic():
+		Popularity.objects.all().delete()
+		Popularity.objects.bulk_create(
+			[
+				Popularity(content_type_id=content_type_id, object_id=object_id, decayed_at=now, **row)
+				for (content_type_id, object_id), row in totals.items()
+			],
+			batch_size=BATCH_SIZE,
+		)
+	return len(totals)
+
+
+def _ranked(model, order_field, limit, queryset=None):
+	from .models import Popularity
+
+	ids = list(
+		Popularity.objects.filter(content_type=ContentType.objects.get_for_model(model), **{f'{order_field}__gt': 0})
+		.order_by(f'-{order_field}', 'object_id')
+		.values_list('object_id', flat=True)[:limit]
+	)
+	objects = (queryset if queryset is not None else model._default_manager.all()).in_bulk(ids)
+	return [objects[pk] for pk in ids if pk in objects]
+
+
+def trending(model, limit=10, queryset=None):
+	"""The `limit` objects of `model` with the highest trending score, best first."""
+	return _ranked(model, 'trending', limit, queryset)
+
+
+def most_loved(model, limit=10, queryset=None):
+	"""The `limit` objects of `model` with the most heart reactions, best first."""
+	return _ranked(model, 'hearts', limit, queryset)
@@ -0,0 +1,134 @@
+"""
+Compaction of old Reaction rows into daily aggregates.
+
+Reaction keeps a full row per click (IP address, user agent, username), which
+makes it the fastest-growing table. Rows older than REACTION_ROLLUP_AFTER_DAYS
+are folded into ReactionRollup (one row per object, reaction type and day) and
+replaced by a ReactionFingerprint: a keyed 64-bit hash of the IP address, which
+is all add_reaction needs to keep rejecting duplicates and to let a reader take
+an old reaction back. Counts (models.reaction_count, the admin annotations and
+popularity.rebuild) read the rollups plus the recent raw tail.
+"""
+
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+def fingerprint(ip_address):
+	"""Signed 64-bit keyed hash of an IP address (fits a BigIntegerField)."""
+	digest = hashlib.blake2b(
+		(ip_address or '').encode(), digest_size=8, key=settings.SECRET_KEY.encode()[:64],
+	).digest()
+	return int.from_bytes(digest, 'big', signed=True)
+
+
+def rollup_cutoff(now=None):
+	return (now or timezone.now()) - timedelta(days=getattr(settings, 'REACTION_ROLLUP_AFTER_DAYS', 30))
+
+
+def compacted_reaction(content_type, object_id, reaction_type, ip_address):
+	"""The ReactionFingerprint left by a compacted reaction from this IP, or None."""
+	from .models import ReactionFingerprint
+
+	return ReactionFingerprint.objects.filter(
+		content_type=content_type, object_id=object_id, reaction_type=reaction_type,
+		fingerprint=fingerprint(ip_address),
+	).first()
+
+
+def remove_compacted(entry):
+	"""Take back a compacted reaction: drop its fingerprint and its count in the day's rollup."""
+	from .models import ReactionRollup
+
+	with transaction.atomic():
+		entry.delete()
+		ReactionRollup.objects.filter(
+			content_type_id=entry.content_type_id, object_id=entry.object_id,
+			reaction_type=entry.reaction_type, day=entry.day,
+		).update(count=Greatest(F('count') - 1, Value(0)))
+
+
+def delete_reactions_for(content_type, object_ids):
+	"""
+	Delete every reaction on these objects: the raw rows, their rollups and
+	fingerprints. For bulk deletes of the objects themselves, which skip any
+	receivers; call it in the same transaction.
+	"""
+	from .models import Reaction, ReactionFingerprint, ReactionRollup
+
+	for model in (Reaction, ReactionRollup, ReactionFingerprint):
+		model.objects.filter(content_type=content_type, object_id__in=object_ids).delete()
+
+
+def _compact_batch(rows):
+	from .models import Reaction, ReactionFingerprint, ReactionRollup
+
+	counts = {}
+	fingerprints = []
+	for pk, content_type_id, object_id, reaction_type, ip_address, created_at in rows:
+		day = timezone.localdate(created_at)
+		key = (content_type_id, object_id, reaction_type, day)
+		counts[key] = counts.get(key, 0) + 1
+		fingerprints.append(ReactionFingerprint(
+			content_type_id=content_type_id, object_id=object_id, reaction_type=reaction_type,
+			fingerprint=fingerprint(ip_address), day=day,
+		))
+
+	with transaction.atomic():
+		# Rows that can already exist are within this batch's objects and days.
+		existing = {
+			(r.content_type_id, r.object_id, r.reaction_type, r.day): r
+			for r in ReactionRollup.objects.select_for_update().filter(
+				content_type_id__in={k[0] for k in counts},
+				object_id__in={k[1] for k in counts},
+				day__in={k[3] for k in counts},
+			)
+		}
+		updated, created = [], []
+		for key, count in counts.items():
+			if key in existing:
+				existing[key].count += count
+				updated.append(existing[key])
+			else:
+				content_type_id, object_id, reaction_type, day = key
+				created.append(ReactionRollup(
+					content_type_id=content_type_id, object_id=object_id,
+					reaction_type=reaction_type, day=day, count=count,
+				))
+		ReactionRollup.objects.bulk_update(updated, ['count'], batch_size=BATCH_SIZE)
+		ReactionRollup.objects.bulk_create(created, batch_size=BATCH_SIZE)
+		ReactionFingerprint.objects.bulk_create(fingerprints, batch_size=BATCH_SIZE, ignore_conflicts=True)
+		Reaction.objects.filter(pk__in=[row[0] for row in rows]).delete()
+	return len(counts)
+
+
+def compact(before=None, batch_size=BATCH_SIZE, dry_run=False):
+	"""
+	Fold reactions created before `before` into rollups, `batch_size` rows per
+	transaction. Returns (reactions compacted, rollup rows written).
+	"""
+	from .models import Reaction
+
+	old = Reaction.objects.filter(created_at__lt=before or rollup_cutoff())
+	if dry_run:
+		return old.count(), 0
+
+	compacted = rollups = 0
+	while True:
+		rows = list(
+			old.order_by('pk').values_list(
+				'pk', 'content_type_id', 'object_id', 'reaction_type', 'ip_address', 'created_at',
+			)[:batch_size]
+		)
+		if not rows:
+			return compacted, rollups
+		rollups += _compact_batch(rows)
+		compacted += len(rows)
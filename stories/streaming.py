@@ -0,0 +1,56 @@
+"""
+Streamed rendering for long pages.
+
+render_streaming() renders a page template in which some sections are only
+placeholders ({{ deferred.<name> }}), sends everything up to the first
+placeholder (the document head with its CSS/font preloads, the page header),
+then renders and sends each section in turn. episode_detail defers the chapter
+text and the comments/reactions block, so the browser starts fetching styles
+and fonts while the chapter is rendered, and readers can start reading before
+the comments and their reaction counts have been queried.
+
+Sections render after the view has returned, so they run in a copy of the
+view's contextvars (keeping ReplicaRoutingMiddleware's primary pinning). Lazy
+values in the context (querysets, properties) are evaluated by the section
+that uses them.
+
+STREAMING_RESPONSES = False renders the same page as one ordinary response,
+e.g. behind a page cache that does not store streamed responses.
+"""
+
+import secrets
+from contextvars import copy_context
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+def render_streaming(request, template_name, context, sections):
+	"""
+	Respond with `template_name`, rendering each sections[name] template (in
+	order) where the page has {{ deferred.name }}, as separate chunks.
+	"""
+	token = secrets.token_hex(8)
+	markers = {name: mark_safe(f'<!--deferred:{name}:{token}-->') for name in sections}
+	page = render_to_string(template_name, {**context, 'deferred': markers}, request)
+
+	if not getattr(settings, 'STREAMING_RESPONSES', True):
+		for name, section in sections.items():
+			page = page.replace(markers[name], render_to_string(section, context, request), 1)
+		return HttpResponse(page)
+
+	view_context = copy_context()
+
+	def chunks():
+		rest = page
+		for name, section in sections.items():
+			if markers[name] not in rest:
+				continue
+			head, _, rest = rest.partition(markers[name])
+			yield head
+			yield view_context.run(render_to_string, section, context, request)
+		yield rest
+
+	return StreamingHttpResponse(chunks(), content_type='text/html; charset=utf-8')
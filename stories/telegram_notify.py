@@ -1,3 +1,4 @@
+import html
 import logging
 import urllib.request
 import urllib.parse
@@ -5,6 +6,8 @@ import json
 
 from django.conf import settings
 
+from vaahakainn import metrics
+
 logger = logging.getLogger(__name__)
 
 
@@ -14,6 +17,7 @@ def send_channel_message(text):
 
     if not token or not channel:
         logger.warning("Telegram bot token or channel not configured — skipping notification.")
+        metrics.inc('telegram_messages_total', result='skipped')
         return
 
     url = f"https://api.telegram.org/bot{token}/sendMessage"
@@ -29,8 +33,13 @@ def send_channel_message(text):
         with urllib.request.urlopen(req, timeout=10) as resp:
             if resp.status != 200:
                 logger.error("Telegram API returned %s", resp.status)
+                metrics.inc('telegram_messages_total', result='failed')
+                return
     except Exception as exc:
         logger.error("Failed to send Telegram notification: %s", exc)
+        metrics.inc('telegram_messages_total', result='failed')
+        return
+    metrics.inc('telegram_messages_total', result='sent')
 
 
 def notify_new_episode(episode):
@@ -74,3 +83,36 @@ def notify_new_short_story(short_story):
         f"<a href='{link}'>Read now →</a>"
     )
     send_channel_message(text)
+
+
+def notify_bulk_import(episodes, short_stories, max_items=10):
+    """One channel post summarising a bulk import instead of one post per row."""
+    if not episodes and not short_stories:
+        return
+    site_url = getattr(settings, 'SITE_URL', '').rstrip('/')
+    lines = []
+
+    if episodes:
+        lines.append(f"✨ <b>{len(episodes)} new episode{'s' if len(episodes) != 1 else ''}!</b>")
+        for episode in episodes[:max_items]:
+            story_name = html.escape(episode.story.title_en or episode.story.title_dv) if episode.story else ''
+            prefix = f"{story_name} — " if story_name else ''
+            lines.append(
+                f"• {prefix}Episode {episode.episode_number}: "
+                f"<a href='{site_url}/episodes/{episode.pk}/'>{html.escape(episode.title_en or episode.title_dv)}</a>"
+            )
+        if len(episodes) > max_items:
+            lines.append(f"…and {len(episodes) - max_items} more")
+
+    if short_stories:
+        if lines:
+            lines.append('')
+        lines.append(f"🌸 <b>{len(short_stories)} new short stor{'ies' if len(short_stories) != 1 else 'y'}!</b>")
+        for short_story in short_stories[:max_items]:
+            lines.append(
+                f"• <a href='{site_url}/short-stories/{short_story.pk}/'>{html.escape(short_story.title_en or short_story.title_dv)}</a>"
+            )
+        if len(short_stories) > max_items:
+            lines.append(f"…and {len(short_stories) - max_items} more")
+
+    send_channel_message("\n".join(lines))
@@ -0,0 +1,11 @@
+from django import template
+
+from stories.image_placeholders import sized_url
+
+register = template.Library()
+
+
+@register.filter
+def sized(image, width):
+	"""{{ story.cover_image|sized:400 }}: the eagerly generated rendition at most 400px wide."""
+	return sized_url(image, int(width))
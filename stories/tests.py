@@ -1,3 +1,434 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import brotli
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import FileResponse, HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from vaahakainn.metrics import MetricsMiddleware
+from vaahakainn.middleware import REPLICA_PIN_COOKIE, CompressionMiddleware, ReplicaRoutingMiddleware
+from vaahakainn.routers import PrimaryReplicaRouter, is_pinned_to_primary, use_primary
+
+from . import home_snapshot, popularity, reaction_rollups, toc, view_counts
+from .home_snapshot import SNAPSHOT_KEY
+from .models import (
+	Author, Category, Comment, DailyViews, Episode, Genre, Popularity, Reaction, ReactionFingerprint, ReactionRollup, ShortStory,
+	Story, reaction_count,
+)
+
+
+# Tests run without collectstatic, so there is no manifest to hash names with.
+PLAIN_STATIC_STORAGES = {
+	'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+	'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], SECURE_SSL_REDIRECT=False, STORAGES=PLAIN_STATIC_STORAGES)
+class ListingProjectionTests(TestCase):
+	"""List pages must never SELECT the chapter/story body columns."""
+
+	BODY_COLUMNS = ('"content_dv"', '"content_en"')
+
+	@classmethod
+	def setUpTestData(cls):
+		category = Category.objects.create(name='Drama')
+		author = Author.objects.create(name='Author')
+		genre = Genre.objects.create(name='Genre')
+		story = Story.objects.create(title_en='Story', title_dv='ސްޓޯރީ', release_date=datetime.date(2024, 1, 1), category=category)
+		for number in (1, 2):
+			Episode.objects.create(
+				story=story, episode_number=number, title_dv=f'ep {number}', title_en=f'Ep {number}',
+				content_dv='body ' * 500, content_en='body ' * 500,
+				published_date=datetime.date(2024, 1, number), author=author, genre=genre,
+			)
+		ShortStory.objects.create(
+			title_dv='short', title_en='Short', author=author, genre=genre, category=category,
+			content_dv='body ' * 500, content_en='body ' * 500,
+			published_date=datetime.date(2024, 1, 1), is_featured=True,
+		)
+		cls.story = story
+
+	def assertNoBodyColumns(self, url):
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		for query in queries.captured_queries:
+			sql = query['sql']
+			if 'stories_episode' in sql or 'stories_shortstory' in sql:
+				for column in self.BODY_COLUMNS:
+					self.assertNotIn(column, sql, f'{url} selected a body column: {sql}')
+
+	def test_home(self):
+		self.assertNoBodyColumns(reverse('home'))
+
+	def test_episode_list(self):
+		self.assertNoBodyColumns(reverse('episode_list'))
+
+	def test_story_list(self):
+		self.assertNoBodyColumns(reverse('story_list'))
+
+	def test_story_detail(self):
+		self.assertNoBodyColumns(reverse('story_detail', args=[self.story.pk]))
+
+	def test_short_story_list(self):
+		self.assertNoBodyColumns(reverse('short_story_list'))
+
+
+class MetricsMiddlewareTests(SimpleTestCase):
+	def test_file_response_keeps_file_to_stream(self):
+		"""Static and media files must still reach wsgi.file_wrapper (sendfile)."""
+		middleware = MetricsMiddleware(lambda request: FileResponse(io.BytesIO(b'data')))
+		response = middleware(RequestFactory().get('/media/cover.jpg'))
+		self.assertIsNotNone(response.file_to_stream)
+		self.assertEqual(b''.join(response.streaming_content), b'data')
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], SECURE_SSL_REDIRECT=False, STORAGES=PLAIN_STATIC_STORAGES)
+class CommentModerationTests(TestCase):
+	def test_delete_removes_compacted_reactions(self):
+		"""Moderation deletes must not leave rollups or fingerprints counting for a deleted comment."""
+		story = Story.objects.create(title_en='Story', title_dv='Story', release_date=datetime.date(2024, 1, 1))
+		story_ct = ContentType.objects.get_for_model(Story)
+		comment_ct = ContentType.objects.get_for_model(Comment)
+		deleted, kept = (
+			Comment.objects.create(content_type=story_ct, object_id=story.pk, username=name, comment='A comment')
+			for name in ('deleted', 'kept')
+		)
+		for comment in (deleted, kept):
+			target = {'content_type': comment_ct, 'object_id': comment.pk, 'reaction_type': 'heart'}
+			Reaction.objects.create(ip_address='10.0.0.1', **target)
+			ReactionRollup.objects.create(day=datetime.date(2024, 1, 1), count=3, **target)
+			ReactionFingerprint.objects.create(day=datetime.date(2024, 1, 1), fingerprint=1, **target)
+
+		self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+		response = self.client.post(
+			reverse('admin:stories_comment_moderation'), {'action': 'delete', 'ids': [deleted.pk]},
+		)
+		self.assertEqual(response.status_code, 302)
+
+		self.assertFalse(Comment.objects.filter(pk=deleted.pk).exists())
+		for model in (Reaction, ReactionRollup, ReactionFingerprint):
+			self.assertEqual(
+				list(model.objects.filter(content_type=comment_ct).values_list('object_id', flat=True)), [kept.pk],
+			)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], SECURE_SSL_REDIRECT=False, STORAGES=PLAIN_STATIC_STORAGES)
+class CompressionMiddlewareTests(TestCase):
+	BODY = '<p>ދިވެހި text</p>'.encode() * 200
+
+	def setUp(self):
+		caches['compressed'].clear()
+
+	def compress(self, encoding, response):
+		middleware = CompressionMiddleware(lambda request: response)
+		return middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING=encoding))
+
+	def test_round_trip(self):
+		for encoding, decompress in (('br', brotli.decompress), ('gzip', gzip.decompress)):
+			response = self.compress(encoding, HttpResponse(self.BODY))
+			self.assertEqual(response['Content-Encoding'], encoding)
+			self.assertEqual(decompress(response.content), self.BODY)
+
+	def test_same_page_is_compressed_once(self):
+		"""Public read views send Vary: Cookie; their bodies are still cached by hash."""
+		with mock.patch('vaahakainn.middleware.brotli.compress', wraps=brotli.compress) as compress:
+			first = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='br')
+			second = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='br')
+		self.assertIn('Cookie', first['Vary'])
+		self.assertEqual(second['Content-Encoding'], 'br')
+		self.assertEqual(first.content, second.content)
+		self.assertEqual(compress.call_count, 1)
+		self.assertEqual(len(caches['compressed']._cache), 1)
+
+	def test_set_cookie_is_not_cached(self):
+		response = HttpResponse(self.BODY)
+		response.set_cookie('csrftoken', 'secret')
+		self.compress('br', response)
+		self.assertEqual(len(caches['compressed']._cache), 0)
+
+
+class FixEpisodesTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	def test_renumber_keeps_order_and_refreshes_home(self):
+		author = Author.objects.create(name='Author')
+		story = Story.objects.create(title_en='Story', title_dv='Story', release_date=datetime.date(2024, 1, 1))
+		numbers = {}
+		for number in (9, 2, 5):
+			episode = Episode.objects.create(
+				story=story, episode_number=number, title_dv=f'ep {number}', title_en=f'Ep {number}',
+				content_dv='body', content_en='body', published_date=datetime.date(2024, 1, 1), author=author,
+			)
+			numbers[episode.pk] = number
+		cache.delete(SNAPSHOT_KEY)
+
+		call_command('fix_episodes', renumber=True, story=story.pk, stdout=io.StringIO())
+
+		renumbered = dict(Episode.objects.values_list('pk', 'episode_number'))
+		self.assertEqual(sorted(renumbered.values()), [1, 2, 3])
+		self.assertEqual(sorted(renumbered, key=renumbered.get), sorted(numbers, key=numbers.get))
+		self.assertIsNotNone(cache.get(SNAPSHOT_KEY))
+
+
+class _InlineThread:
+	"""Stands in for threading.Thread: runs the target when started."""
+
+	def __init__(self, target, **kwargs):
+		self.target = target
+
+	def start(self):
+		self.target()
+
+
+class HomeSnapshotRebuildTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	def test_publishing_an_episode_refreshes_the_snapshot(self):
+		author = Author.objects.create(name='Author')
+		story = Story.objects.create(title_en='Story', title_dv='Story', release_date=datetime.date(2024, 1, 1))
+		home_snapshot.rebuild_home_snapshot()
+		self.assertEqual(home_snapshot.get_home_snapshot()['featured_episodes'], [])
+
+		with mock.patch.object(home_snapshot.threading, 'Thread', _InlineThread), \
+				mock.patch.object(home_snapshot, 'connection'), \
+				self.captureOnCommitCallbacks(execute=True):
+			episode = Episode.objects.create(
+				story=story, episode_number=1, title_dv='ep', title_en='Ep', content_dv='body', content_en='body',
+				published_date=datetime.date(2024, 1, 2), author=author,
+			)
+
+		cards = home_snapshot.get_home_snapshot()['featured_episodes']
+		self.assertEqual([card['pk'] for card in cards], [episode.pk])
+
+	def test_background_rebuild_reads_from_primary(self):
+		"""The rebuild thread doesn't inherit the request's pinning, so it pins itself."""
+		pinned = []
+		home_snapshot._rebuild_requested = True
+		with mock.patch.object(home_snapshot, 'rebuild_home_snapshot', lambda: pinned.append(is_pinned_to_primary())), \
+				mock.patch.object(home_snapshot, 'connection'):
+			home_snapshot._rebuild_in_background()
+		self.assertEqual(pinned, [True])
+
+
+class StoryTocTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	def test_toc_is_refreshed_when_the_save_commits(self):
+		author = Author.objects.create(name='Author')
+		story = Story.objects.create(title_en='Story', title_dv='Story', release_date=datetime.date(2024, 1, 1))
+		self.assertEqual(toc.get_story_toc(story.pk), [])
+
+		with self.captureOnCommitCallbacks() as callbacks:
+			episode = Episode.objects.create(
+				story=story, episode_number=1, title_dv='ep', title_en='Ep', content_dv='body', content_en='body',
+				published_date=datetime.date(2024, 1, 2), author=author,
+			)
+			# Not dropped before the commit, when other readers would still
+			# rebuild it from the old rows.
+			self.assertEqual(cache.get(toc._cache_key(story.pk)), [])
+		with mock.patch.object(home_snapshot.threading, 'Thread', _InlineThread), \
+				mock.patch.object(home_snapshot, 'connection'):
+			for callback in callbacks:
+				callback()
+
+		self.assertEqual([entry.pk for entry in toc.get_story_toc(story.pk)], [episode.pk])
+
+
+class ImportEpisodesTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = Author.objects.create(name='Author')
+		self.story = Story.objects.create(title_en='Story', title_dv='Story', release_date=datetime.date(2024, 1, 1))
+
+	def run_import(self, records):
+		with tempfile.TemporaryDirectory() as directory:
+			path = Path(directory, 'records.json')
+			path.write_text(json.dumps(records))
+			stderr = io.StringIO()
+			with mock.patch('stories.telegram_notify.send_channel_message') as send:
+				try:
+					call_command('import_episodes', str(path), stdout=io.StringIO(), stderr=stderr)
+				finally:
+					self.errors = stderr.getvalue()
+		return path, send
+
+	def episode(self, number, **fields):
+		# Dhivehi only, as entered through the admin.
+		return {'story': self.story.pk, 'episode_number': number, 'title_dv': f'ep {number}',
+				'content_dv': 'body', 'published_date': '2024-01-01', 'author': 'Author', **fields}
+
+	def test_import_notifies_once(self):
+		_, send = self.run_import([self.episode(1), self.episode(2), {**self.episode(3), 'type': 'short_story'}])
+		self.assertEqual(Episode.objects.filter(story=self.story).count(), 2)
+		self.assertEqual(ShortStory.objects.count(), 1)
+		send.assert_called_once()
+
+	def test_invalid_record_imports_nothing(self):
+		with self.assertRaises(CommandError):
+			self.run_import([self.episode(1), self.episode(2, published_date='2024-02-30')])
+		self.assertIn('records.json[2]: published_date', self.errors)
+		self.assertFalse(Episode.objects.exists())
+
+
+class PopularityTests(TestCase):
+	def totals(self):
+		return {
+			(row.content_type_id, row.object_id): (row.reactions, row.hearts, row.comments, round(row.trending, 3))
+			for row in Popularity.objects.all()
+		}
+
+	def test_incremental_totals_match_a_rebuild(self):
+		"""Engagement with an episode counts towards it and its story, as update_popularity --rebuild would."""
+		author = Author.objects.create(name='Author')
+		story, other = (
+			Story.objects.create(title_en=title, title_dv=title, release_date=datetime.date(2024, 1, 1))
+			for title in ('Story', 'Other')
+		)
+		episode = Episode.objects.create(
+			story=story, episode_number=1, title_dv='ep', title_en='Ep', content_dv='body', content_en='body',
+			published_date=datetime.date(2024, 1, 2), author=author,
+		)
+		episode_ct = ContentType.objects.get_for_model(Episode)
+		for ip, reaction_type in (('10.0.0.1', 'heart'), ('10.0.0.2', 'heart'), ('10.0.0.3', 'wow')):
+			Reaction.objects.create(content_type=episode_ct, object_id=episode.pk, reaction_type=reaction_type, ip_address=ip)
+		Comment.objects.create(content_type=episode_ct, object_id=episode.pk, username='reader', comment='Lovely chapter')
+		Comment.objects.create(
+			content_type=episode_ct, object_id=episode.pk, username='spam', comment='Unapproved', is_approved=False,
+		)
+		Reaction.objects.create(
+			content_type=ContentType.objects.get_for_model(Story), object_id=other.pk, reaction_type='heart', ip_address='10.0.0.1',
+		)
+
+		incremental = self.totals()
+		self.assertEqual(incremental[(episode_ct.pk, episode.pk)][:3], (3, 2, 1))
+		self.assertEqual(incremental[(ContentType.objects.get_for_model(Story).pk, story.pk)][:3], (3, 2, 1))
+		self.assertEqual(popularity.trending(Story, 2), [story, other])
+		self.assertEqual(popularity.most_loved(Story, 2), [story, other])
+
+		popularity.rebuild()
+		self.assertEqual(self.totals(), incremental)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], SECURE_SSL_REDIRECT=False, STORAGES=PLAIN_STATIC_STORAGES)
+class ReactionCompactionTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.story = Story.objects.create(title_en='Story', title_dv='Story', release_date=datetime.date(2024, 1, 1))
+
+	def react(self, ip, reaction_type='heart'):
+		response = self.client.post(
+			reverse('add_reaction'),
+			json.dumps({'content_type': 'story', 'object_id': self.story.pk, 'reaction_type': reaction_type}),
+			content_type='application/json', REMOTE_ADDR=ip,
+		)
+		return response.json()
+
+	def test_counts_survive_compaction(self):
+		for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+			self.react(ip)
+		self.react('10.0.0.1', 'wow')
+		before = (reaction_count(self.story), reaction_count(self.story, 'heart'))
+		self.assertEqual(before, (4, 3))
+
+		compacted, _ = reaction_rollups.compact(before=timezone.now() + datetime.timedelta(seconds=1))
+		self.assertEqual(compacted, 4)
+		self.assertFalse(Reaction.objects.exists())
+		self.assertEqual((reaction_count(self.story), reaction_count(self.story, 'heart')), before)
+
+		# The fingerprint still lets the same reader take a compacted reaction back.
+		self.assertEqual(self.react('10.0.0.2'), {'success': True, 'action': 'removed', 'total_reactions': 3})
+		self.assertEqual(reaction_count(self.story, 'heart'), 2)
+		self.assertEqual(self.react('10.0.0.2')['action'], 'added')
+		self.assertEqual(reaction_count(self.story, 'heart'), 3)
+
+
+class ViewCountTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		# Drop whatever earlier view tests left in this worker's buffer.
+		view_counts.flush()
+		DailyViews.objects.all().delete()
+		self.story = Story.objects.create(title_en='Story', title_dv='Story', release_date=datetime.date(2024, 1, 1))
+
+	def counts(self):
+		return list(DailyViews.objects.filter(object_id=self.story.pk).values_list('day', 'views', 'reads'))
+
+	def test_buffered_views_flush_with_the_right_totals(self):
+		self.assertTrue(view_counts.record(Story, self.story.pk, 'reader-a'))
+		self.assertFalse(view_counts.record(Story, self.story.pk, 'reader-a'))  # repeat within VIEW_DEDUP_SECONDS
+		self.assertTrue(view_counts.record(Story, self.story.pk, 'reader-b'))
+		self.assertTrue(view_counts.record(Story, self.story.pk, 'reader-a', view_counts.READ))
+		self.assertEqual(self.counts(), [])  # nothing written until the flush
+
+		self.assertEqual(view_counts.flush(), 1)
+		today = timezone.localdate()
+		self.assertEqual(self.counts(), [(today, 2, 1)])
+
+		view_counts.record(Story, self.story.pk, 'reader-c')
+		view_counts.flush()
+		self.assertEqual(self.counts(), [(today, 3, 1)])
+
+	@override_settings(VIEW_FLUSH_MAX_KEYS=2)
+	def test_full_buffer_flushes(self):
+		other = Story.objects.create(title_en='Other', title_dv='Other', release_date=datetime.date(2024, 1, 1))
+		view_counts.record(Story, self.story.pk, 'reader-a')
+		self.assertEqual(self.counts(), [])
+		view_counts.record(Story, other.pk, 'reader-a')
+		self.assertEqual(view_counts.pending(), {})
+		self.assertEqual(DailyViews.objects.count(), 2)
+
+
+@override_settings(DATABASE_REPLICA_URL='postgres://replica/db')
+class ReplicaRoutingTests(SimpleTestCase):
+	router = PrimaryReplicaRouter()
+
+	def test_reads_go_to_the_replica_unless_pinned(self):
+		self.assertEqual(self.router.db_for_read(Story), 'replica')
+		with use_primary():
+			self.assertEqual(self.router.db_for_read(Story), 'default')
+		self.assertEqual(self.router.db_for_read(Story), 'replica')
+		self.assertEqual(self.router.db_for_write(Story), 'default')
+
+	def route(self, request):
+		"""The alias the view behind ReplicaRoutingMiddleware would read from, and the response."""
+		seen = []
+
+		def view(request):
+			seen.append(self.router.db_for_read(Story))
+			return HttpResponse()
+
+		response = ReplicaRoutingMiddleware(view)(request)
+		return seen[0], response
+
+	def test_writes_pin_the_client_to_the_primary(self):
+		factory = RequestFactory()
+		self.assertEqual(self.route(factory.get('/stories/'))[0], 'replica')
+		self.assertEqual(self.route(factory.get(reverse('admin:index')))[0], 'default')
+
+		alias, response = self.route(factory.post('/api/reactions/add/'))
+		self.assertEqual(alias, 'default')
+		self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+
+		pinned = factory.get('/stories/')
+		pinned.COOKIES[REPLICA_PIN_COOKIE] = '1'
+		self.assertEqual(self.route(pinned)[0], 'default')
+		self.assertFalse(is_pinned_to_primary())
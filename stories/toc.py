@@ -0,0 +1,99 @@
+"""
+Cached per-story table of contents.
+
+A story's TOC is the ordered list of its episodes' display fields. It is built
+with one query, cached, and dropped once a save or delete of one of that
+story's episodes commits (receivers in models.py); bulk maintenance commands call
+invalidate_story_toc() themselves. story_detail renders the TOC directly and
+episode_detail takes its previous/next links from it, so sequential reading
+costs no ordering queries.
+
+With the default per-process cache, another worker's copy is only refreshed
+when it expires (STORY_TOC_CACHE_SECONDS); point CACHES at Redis for instant
+invalidation everywhere.
+"""
+
+from dataclasses import dataclass
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+
+from vaahakainn import metrics
+
+GENERATION_KEY = 'story_toc:generation'
+
+
+@dataclass(frozen=True)
+class TocEntry:
+	pk: int
+	episode_number: int
+	title_dv: str
+	title_en: str
+	published_date: date
+	author_name: str
+	genre_name: str
+	genre_icon: str
+
+
+def _generation():
+	return cache.get_or_set(GENERATION_KEY, 1, None)
+
+
+def _cache_key(story_id):
+	return f'story_toc:{_generation()}:{story_id}'
+
+
+def toc_queryset(story_id):
+	from .models import Episode
+
+	return (
+		Episode.objects.filter(story_id=story_id)
+		.order_by('episode_number', 'pk')
+		.values_list(
+			'pk', 'episode_number', 'title_dv', 'title_en', 'published_date',
+			'author__name', 'genre__name', 'genre__icon',
+		)
+	)
+
+
+def build_story_toc(story_id):
+	rows = toc_queryset(story_id)
+	return [
+		TocEntry(pk, number, title_dv, title_en, published, author or '', genre or '', icon or '')
+		for pk, number, title_dv, title_en, published, author, genre, icon in rows
+	]
+
+
+def get_story_toc(story_id):
+	if story_id is None:
+		return []
+	key = _cache_key(story_id)
+	toc = cache.get(key)
+	metrics.inc('cache_requests_total', cache='story_toc', result='miss' if toc is None else 'hit')
+	if toc is None:
+		toc = build_story_toc(story_id)
+		cache.set(key, toc, getattr(settings, 'STORY_TOC_CACHE_SECONDS', 600))
+	return toc
+
+
+def invalidate_story_toc(*story_ids):
+	cache.delete_many([_cache_key(story_id) for story_id in story_ids if story_id is not None])
+
+
+def invalidate_all_tocs():
+	"""Used when data shown in every TOC changes (author/genre names) or after bulk edits."""
+	try:
+		cache.incr(GENERATION_KEY)
+	except ValueError:
+		cache.set(GENERATION_KEY, 2, None)
+
+
+def neighbours(toc, episode_id):
+	"""(previous, next) TocEntry around `episode_id`, either may be None."""
+	for index, entry in enumerate(toc):
+		if entry.pk == episode_id:
+			previous = toc[index - 1] if index > 0 else None
+			following = toc[index + 1] if index + 1 < len(toc) else None
+			return previous, following
+	return None, None
@@ -0,0 +1,121 @@
+"""
+Buffered page-view and read-completion counters.
+
+Counting a view must not turn a read into a write, so record() only bumps an
+in-memory counter in the current worker. After VIEW_FLUSH_SECONDS (checked when
+a request finishes, after its response has gone out) or once the buffer holds
+VIEW_FLUSH_MAX_KEYS objects, the worker writes everything it has collected to
+DailyViews in one transaction: one SELECT of the existing rows, then one
+bulk UPDATE and one bulk INSERT. A crashed worker loses at most one flush
+interval of counts; gunicorn's worker_exit hook flushes on a clean shutdown.
+
+The same visitor (IP address + user agent) is counted once per object and
+event within VIEW_DEDUP_SECONDS, using cache.add(); with the default per-process
+cache that window is per worker.
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .reaction_rollups import fingerprint
+
+logger = logging.getLogger(__name__)
+
+VIEW = 'views'
+READ = 'reads'
+EVENTS = (VIEW, READ)
+
+_lock = threading.Lock()
+_buffer = {}  # (content_type_id, object_id, day) -> {'views': n, 'reads': n}
+_last_flush = time.monotonic()
+
+
+def _seen_recently(event, content_type_id, object_id, visitor):
+	key = f'seen:{event}:{content_type_id}:{object_id}:{fingerprint(visitor)}'
+	return not cache.add(key, 1, getattr(settings, 'VIEW_DEDUP_SECONDS', 1800))
+
+
+def record(model, object_id, visitor, event=VIEW):
+	"""Count one view (or read completion) of a `model` row by `visitor`; returns False for a repeat."""
+	content_type_id = ContentType.objects.get_for_model(model).pk
+	if _seen_recently(event, content_type_id, object_id, visitor):
+		return False
+	key = (content_type_id, object_id, timezone.localdate())
+	with _lock:
+		counts = _buffer.setdefault(key, {VIEW: 0, READ: 0})
+		counts[event] += 1
+		full = len(_buffer) >= getattr(settings, 'VIEW_FLUSH_MAX_KEYS', 5000)
+	if full:
+		flush()
+	return True
+
+
+def pending():
+	"""Unflushed counts in this worker, for diagnostics."""
+	with _lock:
+		return {key: dict(counts) for key, counts in _buffer.items()}
+
+
+def _write(batch):
+	from .models import DailyViews
+
+	with transaction.atomic():
+		# Rows that can already exist are within this batch's objects and days.
+		existing = {
+			(row.content_type_id, row.object_id, row.day): row
+			for row in DailyViews.objects.select_for_update().filter(
+				content_type_id__in={key[0] for key in batch},
+				object_id__in={key[1] for key in batch},
+				day__in={key[2] for key in batch},
+			)
+		}
+		updated, created = [], []
+		for key, counts in batch.items():
+			if key in existing:
+				row = existing[key]
+				row.views += counts[VIEW]
+				row.reads += counts[READ]
+				updated.append(row)
+			else:
+				content_type_id, object_id, day = key
+				created.append(DailyViews(
+					content_type_id=content_type_id, object_id=object_id, day=day,
+					views=counts[VIEW], reads=counts[READ],
+				))
+		DailyViews.objects.bulk_update(updated, [VIEW, READ], batch_size=500)
+		DailyViews.objects.bulk_create(created, batch_size=500)
+
+
+def flush():
+	"""Write this worker's buffered counts to the database; returns the number of rows touched."""
+	global _buffer, _last_flush
+	with _lock:
+		batch, _buffer = _buffer, {}
+		_last_flush = time.monotonic()
+	if not batch:
+		return 0
+	try:
+		try:
+			_write(batch)
+		except IntegrityError:
+			_write(batch)  # another worker inserted one of the rows first
+	except Exception:
+		logger.exception('Flushing %d view counters failed; they are dropped', len(batch))
+		return 0
+	return len(batch)
+
+
+def _flush_when_due(sender, **kwargs):
+	if _buffer and time.monotonic() - _last_flush >= getattr(settings, 'VIEW_FLUSH_SECONDS', 30):
+		flush()
+
+
+request_finished.connect(_flush_when_due, dispatch_uid='stories.view_counts.flush')
@@ -1,11 +1,21 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.http import require_POST
-from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
+from django.views.decorators.vary import vary_on_cookie
 from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
+from django.db.models import Prefetch
+from django.conf import settings
 import logging
 from .models import Episode, Story, Category, Comment, Reaction, ShortStory
+from .toc import get_story_toc, neighbours
+from .home_snapshot import get_home_snapshot
+from .popularity import record_reaction
+from .reaction_rollups import compacted_reaction, remove_compacted
+from .streaming import render_streaming
+from . import view_counts
+from vaahakainn import metrics
 import json
 
 logger = logging.getLogger(__name__)
@@ -23,6 +33,7 @@ def _rate_limited(request, action, limit, window_seconds):
     key = f'ratelimit:{action}:{ip}'
     count = cache.get(key, 0)
     if count >= limit:
+        metrics.inc('rate_limit_rejections_total', action=action)
         return True
     # add() sets the key with TTL only if absent, so the window starts on first hit
     cache.add(key, 0, window_seconds)
@@ -32,85 +43,142 @@ def _rate_limited(request, action, limit, window_seconds):
         cache.set(key, 1, window_seconds)
     return False
 
+# Reader language lives in a signed cookie (or an explicit ?lang= override) rather
+# than the session, so anonymous page views never hit the session store and the
+# responses stay cacheable by a reverse proxy / CDN (keyed on Vary: Cookie).
+LANG_COOKIE_NAME = 'lang'
+LANG_COOKIE_SALT = 'stories.lang'
+LANG_COOKIE_MAX_AGE = 60 * 60 * 24 * 365
+SUPPORTED_LANGS = ('dv', 'en')
+DEFAULT_LANG = 'dv'
+
+def get_lang(request):
+    lang = request.GET.get('lang')
+    if lang in SUPPORTED_LANGS:
+        return lang
+    lang = request.get_signed_cookie(LANG_COOKIE_NAME, default=None, salt=LANG_COOKIE_SALT)
+    return lang if lang in SUPPORTED_LANGS else DEFAULT_LANG
+
+# Views and read completions (stories/view_counts.py). Speculative prefetches and
+# prerenders (episode_detail's next-episode hints) are not counted when fetched;
+# such pages are rendered with view_counted=False and report the view through
+# track() if the reader actually opens them.
+TRACKED_MODELS = {'story': Story, 'episode': Episode, 'shortstory': ShortStory}
+
+def _is_speculative(request):
+    return 'prefetch' in request.headers.get('Sec-Purpose', request.headers.get('Purpose', ''))
+
+def _visitor(request):
+    return f"{get_client_ip(request)}|{request.META.get('HTTP_USER_AGENT', '')}"
+
+def count_view(request, obj):
+    """Count a view of `obj` unless the request is speculative; returns whether it was counted."""
+    if _is_speculative(request):
+        return False
+    view_counts.record(type(obj), obj.pk, _visitor(request))
+    return True
+
+# The list and detail queries, shared with manage.py check_query_plans so it
+# EXPLAINs exactly what the views run.
+def story_list_queryset(category_id=None):
+    # Cards show the episode count and the first episode's author/genre:
+    # a COUNT subquery and one episode per story (sliced prefetch, ROW_NUMBER() window).
+    stories = Story.objects.select_related('category').with_episode_count().prefetch_related(
+        Prefetch(
+            'episodes',
+            queryset=Episode.objects.for_listing().select_related('author', 'genre').order_by('episode_number', 'pk')[:1],
+            to_attr='first_episodes',
+        ),
+    ).order_by('-release_date')
+    if category_id:
+        stories = stories.filter(category__id=category_id)
+    return stories
+
+def short_story_list_queryset(category_id=None):
+    short_stories = ShortStory.objects.for_listing().select_related('author', 'genre', 'category').filter(is_published=True)
+    if category_id:
+        short_stories = short_stories.filter(category__id=category_id)
+    return short_stories.order_by('-published_date')
+
+def approved_comments(content_type, object_id):
+    return Comment.objects.filter(content_type=content_type, object_id=object_id, is_approved=True).order_by('-created_at')
+
+@vary_on_cookie
 def home(request):
-	featured_stories = Story.objects.order_by('-release_date')[:3]
-	featured_episodes = Episode.objects.order_by('-published_date')[:5]
-	featured_short_stories = ShortStory.objects.filter(is_published=True, is_featured=True).order_by('-published_date')[:3]
-	lang = request.session.get('lang', 'dv')
+	snapshot = get_home_snapshot()
+	lang = get_lang(request)
 	return render(request, 'home.html', {
-		'featured_stories': featured_stories,
-		'featured_episodes': featured_episodes,
-		'featured_short_stories': featured_short_stories,
+		'featured_stories': snapshot['featured_stories'],
+		'featured_episodes': snapshot['featured_episodes'],
+		'featured_short_stories': snapshot['featured_short_stories'],
+		'trending_stories': snapshot['trending_stories'],
 		'lang': lang,
 	})
 
+@vary_on_cookie
 def episode_list(request):
-	episodes = Episode.objects.order_by('episode_number')
-	lang = request.session.get('lang', 'dv')
+	episodes = Episode.objects.for_listing().select_related('author', 'genre').order_by('episode_number')
+	lang = get_lang(request)
 	return render(request, 'episode_list.html', {
 		'episodes': episodes,
 		'lang': lang,
 	})
 
+EPISODE_SECTIONS = {
+	'chapter': 'episode_detail_chapter.html',
+	'engagement': 'episode_detail_engagement.html',
+}
+
 @ensure_csrf_cookie
+@vary_on_cookie
 def episode_detail(request, pk):
-	episode = get_object_or_404(Episode, pk=pk)
-	lang = request.session.get('lang', 'dv')
+	episode = get_object_or_404(Episode.objects.select_related('story'), pk=pk)
+	lang = get_lang(request)
 	
 	story = episode.story
 
-	# Get previous and next episodes within the same story
-	previous_episode = None
-	next_episode = None
-
-	if story:
-		story_episodes = story.episodes.order_by('episode_number')
-		
-		# Find previous episode
-		previous_episode = story_episodes.filter(
-			episode_number__lt=episode.episode_number
-		).order_by('-episode_number').first()
-		
-		# Find next episode
-		next_episode = story_episodes.filter(
-			episode_number__gt=episode.episode_number
-		).order_by('episode_number').first()
+	# Previous / next episode within the same story, from the cached TOC
+	previous_episode, next_episode = neighbours(get_story_toc(episode.story_id), episode.pk)
+	view_counted = count_view(request, episode)
 	
-	# Get comments for this episode
-	episode_ct = ContentType.objects.get_for_model(Episode)
-	comments = Comment.objects.filter(
-		content_type=episode_ct, 
-		object_id=episode.id, 
-		is_approved=True
-	).order_by('-created_at')
+	comments = approved_comments(ContentType.objects.get_for_model(Episode), episode.id)
 	
-	return render(request, 'episode_detail.html', {
+	# Head, header and navigation go out first, then the chapter, then the
+	# comments and reaction counts (stories/streaming.py).
+	return render_streaming(request, 'episode_detail.html', {
 		'episode': episode,
 		'story': story,
 		'previous_episode': previous_episode,
 		'next_episode': next_episode,
 		'comments': comments,
+		'view_counted': view_counted,
 		'lang': lang,
-	})
+	}, sections=EPISODE_SECTIONS)
 
 def book_teaser(request):
 	book = Story.objects.order_by('-release_date').first()
 	return render(request, 'book_teaser.html', {'book': book})
 
 def toggle_language(request):
-	current = request.session.get('lang', 'dv')
-	request.session['lang'] = 'en' if current == 'dv' else 'dv'
-	return redirect(request.META.get('HTTP_REFERER', '/'))
-
+	current = get_lang(request)
+	response = redirect(request.META.get('HTTP_REFERER', '/'))
+	response.set_signed_cookie(
+		LANG_COOKIE_NAME,
+		'en' if current == 'dv' else 'dv',
+		salt=LANG_COOKIE_SALT,
+		max_age=LANG_COOKIE_MAX_AGE,
+		secure=settings.SESSION_COOKIE_SECURE,
+		samesite='Lax',
+	)
+	return response
+
+@vary_on_cookie
 def story_list(request):
     category_filter = request.GET.get('category')
-    if category_filter:
-        stories = Story.objects.filter(category__id=category_filter).order_by('-release_date')
-    else:
-        stories = Story.objects.order_by('-release_date')
+    stories = story_list_queryset(category_filter)
     
     categories = Category.objects.filter(is_active=True).order_by('name')
-    lang = request.session.get('lang', 'dv')
+    lang = get_lang(request)
     
     return render(request, 'story_list.html', {
         'stories': stories,
@@ -120,10 +188,12 @@ def story_list(request):
     })
 
 @ensure_csrf_cookie
+@vary_on_cookie
 def story_detail(request, pk):
     story = get_object_or_404(Story, pk=pk)
-    episodes = story.episodes.order_by('episode_number')
-    lang = request.session.get('lang', 'dv')
+    episodes = get_story_toc(story.pk)
+    lang = get_lang(request)
+    count_view(request, story)
 
     return render(request, 'story_detail.html', {
         'story': story,
@@ -180,10 +250,10 @@ def add_comment(request):
                 content_obj = Story.objects.get(pk=object_id)
             elif content_type == 'episode':
                 ct = ContentType.objects.get_for_model(Episode)
-                content_obj = Episode.objects.get(pk=object_id)
+                content_obj = Episode.objects.for_listing().get(pk=object_id)
             elif content_type == 'shortstory':
                 ct = ContentType.objects.get_for_model(ShortStory)
-                content_obj = ShortStory.objects.get(pk=object_id)
+                content_obj = ShortStory.objects.for_listing().get(pk=object_id)
             else:
                 return JsonResponse({'success': False, 'error': 'Invalid content type'})
         except (Story.DoesNotExist, Episode.DoesNotExist, ShortStory.DoesNotExist):
@@ -199,6 +269,7 @@ def add_comment(request):
             ip_address=get_client_ip(request),
             is_approved=True  # Auto-approve for now
         )
+        metrics.inc('comments_created_total')
 
         return JsonResponse({
             'success': True,
@@ -244,10 +315,10 @@ def add_reaction(request):
                 content_obj = Story.objects.get(pk=object_id)
             elif content_type == 'episode':
                 ct = ContentType.objects.get_for_model(Episode)
-                content_obj = Episode.objects.get(pk=object_id)
+                content_obj = Episode.objects.for_listing().get(pk=object_id)
             elif content_type == 'shortstory':
                 ct = ContentType.objects.get_for_model(ShortStory)
-                content_obj = ShortStory.objects.get(pk=object_id)
+                content_obj = ShortStory.objects.for_listing().get(pk=object_id)
             elif content_type == 'comment':
                 ct = ContentType.objects.get_for_model(Comment)
                 content_obj = Comment.objects.get(pk=object_id)
@@ -267,9 +338,24 @@ def add_reaction(request):
             reaction_type=reaction_type
         ).first()
         
+        if existing_reaction is None:
+            # Reactions older than REACTION_ROLLUP_AFTER_DAYS only survive as a fingerprint.
+            compacted = compacted_reaction(ct, object_id, reaction_type, client_ip)
+            if compacted:
+                remove_compacted(compacted)
+                record_reaction(compacted, sign=-1)
+                metrics.inc('reactions_total', action='removed')
+                return JsonResponse({
+                    'success': True,
+                    'action': 'removed',
+                    'total_reactions': content_obj.total_reactions
+                })
+
         if existing_reaction:
             # Remove reaction (toggle)
             existing_reaction.delete()
+            record_reaction(existing_reaction, sign=-1)
+            metrics.inc('reactions_total', action='removed')
             return JsonResponse({
                 'success': True, 
                 'action': 'removed',
@@ -285,7 +371,8 @@ def add_reaction(request):
                 ip_address=client_ip,
                 user_agent=user_agent
             )
-            
+            metrics.inc('reactions_total', action='added')
+
             return JsonResponse({
                 'success': True, 
                 'action': 'added',
@@ -299,6 +386,25 @@ def add_reaction(request):
         logger.exception('add_reaction failed')
         return JsonResponse({'success': False, 'error': 'Something went wrong. Please try again.'}, status=500)
 
+# Analytics beacons carry no user data and only bump deduplicated counters, so
+# they are sent with navigator.sendBeacon() and need no CSRF token.
+@csrf_exempt
+@require_POST
+def track(request):
+    model = TRACKED_MODELS.get(request.POST.get('content_type'))
+    event = request.POST.get('event', view_counts.VIEW)
+    try:
+        object_id = int(request.POST.get('object_id', ''))
+    except ValueError:
+        return HttpResponse(status=400)
+    if model is None or event not in view_counts.EVENTS:
+        return HttpResponse(status=400)
+
+    if not model.objects.filter(pk=object_id).exists():
+        return HttpResponse(status=404)
+    view_counts.record(model, object_id, _visitor(request), event)
+    return HttpResponse(status=204)
+
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     if x_forwarded_for:
@@ -307,18 +413,13 @@ def get_client_ip(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
+@vary_on_cookie
 def short_story_list(request):
     category_filter = request.GET.get('category')
-    if category_filter:
-        short_stories = ShortStory.objects.filter(
-            category__id=category_filter, 
-            is_published=True
-        ).order_by('-published_date')
-    else:
-        short_stories = ShortStory.objects.filter(is_published=True).order_by('-published_date')
+    short_stories = short_story_list_queryset(category_filter)
     
     categories = Category.objects.filter(is_active=True).order_by('name')
-    lang = request.session.get('lang', 'dv')
+    lang = get_lang(request)
     
     return render(request, 'short_story_list.html', {
         'short_stories': short_stories,
@@ -328,21 +429,18 @@ def short_story_list(request):
     })
 
 @ensure_csrf_cookie
+@vary_on_cookie
 def short_story_detail(request, pk):
     short_story = get_object_or_404(ShortStory, pk=pk, is_published=True)
-    lang = request.session.get('lang', 'dv')
+    lang = get_lang(request)
+    view_counted = count_view(request, short_story)
     
-    # Get comments for this short story
-    shortstory_ct = ContentType.objects.get_for_model(ShortStory)
-    comments = Comment.objects.filter(
-        content_type=shortstory_ct, 
-        object_id=short_story.id, 
-        is_approved=True
-    ).order_by('-created_at')
+    comments = approved_comments(ContentType.objects.get_for_model(ShortStory), short_story.id)
     
     return render(request, 'short_story_detail.html', {
         'short_story': short_story,
         'comments': comments,
+        'view_counted': view_counted,
         'lang': lang,
     })
 
@@ -0,0 +1,63 @@
+"""
+Per-process counters showing how well database connections are being reused.
+
+Every request that finds no usable persistent connection opens a new one and
+fires `connection_created`; comparing that with the number of finished requests
+gives the reuse ratio. With DB_POOL enabled the signal fires on every pool
+checkout, so "opened" then means "checked out of the pool".
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counts = {'connections_opened': 0, 'requests_finished': 0}
+
+
+def stats():
+    with _lock:
+        opened = _counts['connections_opened']
+        requests = _counts['requests_finished']
+    reused = max(requests - opened, 0)
+    return {
+        'connections_opened': opened,
+        'requests_finished': requests,
+        'reuse_ratio': reused / requests if requests else 0.0,
+    }
+
+
+def reset():
+    with _lock:
+        for key in _counts:
+            _counts[key] = 0
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    with _lock:
+        _counts['connections_opened'] += 1
+        opened = _counts['connections_opened']
+        requests = _counts['requests_finished']
+    logger.debug('Opened DB connection %s (#%d, %d requests served so far)', connection.alias, opened, requests)
+
+
+def _on_request_finished(sender, **kwargs):
+    with _lock:
+        _counts['requests_finished'] += 1
+        requests = _counts['requests_finished']
+    every = getattr(settings, 'DB_STATS_LOG_EVERY', 1000)
+    if every and requests % every == 0:
+        current = stats()
+        logger.info(
+            'DB connections: %d opened for %d requests (reuse ratio %.2f)',
+            current['connections_opened'], current['requests_finished'], current['reuse_ratio'],
+        )
+
+
+connection_created.connect(_on_connection_created, dispatch_uid='vaahakainn.dbstats.connection_created')
+request_finished.connect(_on_request_finished, dispatch_uid='vaahakainn.dbstats.request_finished')
@@ -0,0 +1,77 @@
+"""
+Production serving of files under MEDIA_ROOT.
+
+New uploads go to Cloudinary, so /media/ only serves leftover local files, but
+django.views.static.serve read each one whole through a gunicorn worker with no
+range or conditional request support. serve_media answers instead with one of:
+
+  MEDIA_SERVE_MODE = 'whitenoise'        (default) WhiteNoise's file responder:
+                                         Range/206, ETag and Last-Modified
+                                         (304s), and a file body gunicorn
+                                         hands to sendfile()
+  MEDIA_SERVE_MODE = 'x-accel-redirect'  an empty response telling nginx to
+                                         send MEDIA_ACCEL_PREFIX + path itself
+  MEDIA_SERVE_MODE = 'x-sendfile'        the same for Apache/lighttpd
+                                         (X-Sendfile with the absolute path)
+
+Uploaded names are never reused (storages pick a new name on collision), so
+files are cacheable for MEDIA_CACHE_SECONDS and marked immutable. Anything
+that is not an image, audio, video or PDF is sent as an attachment so an
+uploaded HTML/SVG file cannot run script on our origin.
+"""
+
+import mimetypes
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404, HttpResponse
+from django.utils._os import safe_join
+from django.views.decorators.http import require_safe
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.responders import StaticFile
+
+INLINE_TYPES = ('image/', 'audio/', 'video/', 'application/pdf')
+UNSAFE_INLINE_TYPES = ('image/svg+xml',)
+
+
+def _media_headers(path):
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    seconds = getattr(settings, 'MEDIA_CACHE_SECONDS', 60 * 60 * 24 * 365)
+    headers = [
+        ('Content-Type', content_type),
+        ('Cache-Control', f'public, max-age={seconds}, immutable'),
+    ]
+    if encoding:
+        headers.append(('Content-Encoding', encoding))
+    if not content_type.startswith(INLINE_TYPES) or content_type in UNSAFE_INLINE_TYPES:
+        headers.append(('Content-Disposition', 'attachment'))
+    return headers
+
+
+@require_safe
+def serve_media(request, path):
+    if not settings.MEDIA_ROOT:
+        raise ImproperlyConfigured('serve_media needs MEDIA_ROOT.')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except Exception:  # SuspiciousFileOperation: path escapes MEDIA_ROOT
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'whitenoise')
+    if mode in ('x-accel-redirect', 'x-sendfile'):
+        response = HttpResponse()
+        del response['Content-Type']  # let the front-end server set it
+        if mode == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + path.lstrip('/')
+        else:
+            response['X-Sendfile'] = full_path
+        for key, value in _media_headers(full_path):
+            if key != 'Content-Type':
+                response[key] = value
+        return response
+
+    return WhiteNoiseMiddleware.serve(StaticFile(full_path, _media_headers(full_path)), request)
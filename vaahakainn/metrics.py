@@ -0,0 +1,232 @@
+"""
+In-process metrics with a Prometheus text-format endpoint (/metrics).
+
+Metrics are plain counters and histograms kept in memory by each process. Under
+gunicorn every worker has its own copy, so when METRICS_DIR is set each worker
+also writes its values to METRICS_DIR/<pid>.json (at most every
+METRICS_FLUSH_SECONDS, checked when a request finishes, and when it exits);
+the worker answering a scrape sums all the files. Files of exited workers are
+kept so counters never go backwards; gunicorn.conf.py empties the directory
+when the master starts.
+
+Without METRICS_DIR (a single process, e.g. runserver) the endpoint reports
+the answering process only.
+
+The endpoint answers staff users, or any client sending
+"Authorization: Bearer <METRICS_TOKEN>" when METRICS_TOKEN is set.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests by URL name, method and status code'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by URL name'),
+    'db_queries_total': ('counter', 'Database queries run while handling requests, by URL name'),
+    'cache_requests_total': ('counter', 'Application cache lookups by cache and result (hit/miss)'),
+    'rate_limit_rejections_total': ('counter', 'Requests rejected by the per-IP rate limiter, by action'),
+    'comments_created_total': ('counter', 'Comments posted through the API'),
+    'reactions_total': ('counter', 'Reaction toggles through the API, by action (added/removed)'),
+    'telegram_messages_total': ('counter', 'Telegram channel messages by result (sent/failed/skipped)'),
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(float)  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_last_dump = time.monotonic()
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        _counters[(name, _labels(labels))] += amount
+
+
+def observe(name, value, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 1) + [0.0]
+        for index, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                values[index] += 1
+        values[len(DEFAULT_BUCKETS)] += 1
+        values[-1] += value
+
+
+def _snapshot():
+    with _lock:
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), list(values)] for (name, labels), values in _histograms.items()],
+        }
+
+
+def dump():
+    """Write this process's values to METRICS_DIR (a no-op without it)."""
+    global _last_dump
+    directory = getattr(settings, 'METRICS_DIR', '')
+    _last_dump = time.monotonic()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{os.getpid()}.json')
+    with open(f'{path}.tmp', 'w') as handle:
+        json.dump(_snapshot(), handle)
+    os.replace(f'{path}.tmp', path)
+
+
+def clear_directory(directory):
+    """Remove the per-process files in `directory` (gunicorn.conf.py, before workers start)."""
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                os.remove(os.path.join(directory, name))
+
+
+def _read_directory(directory):
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            try:
+                with open(os.path.join(directory, name)) as handle:
+                    snapshots.append(json.load(handle))
+            except (OSError, ValueError):
+                continue  # being replaced right now
+    return snapshots
+
+
+def collect(directory=None):
+    """Summed (counters, histograms) of this process, or of every process writing to `directory`."""
+    if directory is None:
+        directory = getattr(settings, 'METRICS_DIR', '')
+        if directory:
+            dump()
+    snapshots = _read_directory(directory) if directory else [_snapshot()]
+
+    counters, histograms = defaultdict(float), {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            totals = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                totals[index] += value
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def render():
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value:g}')
+        else:
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(DEFAULT_BUCKETS, values):
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", f"{bound:g}")])} {count}')
+                count = values[len(DEFAULT_BUCKETS)]
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {values[-1]:g}')
+                lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorization = request.headers.get('Authorization', '')
+    allowed = (token and constant_time_compare(authorization, f'Bearer {token}')) or (
+        request.user.is_authenticated and request.user.is_staff
+    )
+    if not allowed:
+        raise Http404
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricsMiddleware:
+    """Request count, latency and query count per URL name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        def record():
+            match = getattr(request, 'resolver_match', None)
+            view = (match.view_name if match else None) or 'unmatched'
+            inc('http_requests_total', view=view, method=request.method, status=response.status_code)
+            observe('http_request_duration_seconds', time.perf_counter() - started, view=view)
+            if queries:
+                inc('db_queries_total', queries, view=view)
+
+        started = time.perf_counter()
+        with self._counting(count_query):
+            response = self.get_response(request)
+        # Streamed sections render (and query) while the body is sent. File
+        # responses are left alone: replacing their iterator would stop the
+        # server from sending the file with wsgi.file_wrapper (sendfile).
+        if response.streaming and not response.is_async and getattr(response, 'file_to_stream', None) is None:
+            response.streaming_content = self._streamed(response.streaming_content, count_query, record)
+        else:
+            record()
+        return response
+
+    @staticmethod
+    def _counting(count_query):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(count_query))
+        return stack
+
+    def _streamed(self, content, count_query, record):
+        try:
+            with self._counting(count_query):
+                yield from content
+        finally:
+            record()
+
+
+def _dump_when_due(sender, **kwargs):
+    if time.monotonic() - _last_dump >= getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+        dump()
+
+
+request_finished.connect(_dump_when_due, dispatch_uid='vaahakainn.metrics.dump')
@@ -1,7 +1,9 @@
 """
-Adds security response headers (Content-Security-Policy, Permissions-Policy)
-to every response. Implemented as a tiny middleware so we don't pull in an
-extra dependency.
+Project-wide middleware.
+
+SecurityHeadersMiddleware adds security response headers
+(Content-Security-Policy, Permissions-Policy) to every response. Implemented as
+a tiny middleware so we don't pull in an extra dependency.
 
 NOTE on the CSP: this codebase relies heavily on inline <script> blocks, inline
 style="" attributes and inline event handlers (onclick / onmouseover), so
@@ -10,12 +12,51 @@ break the site. Even with 'unsafe-inline', the policy still meaningfully reduces
 risk: it blocks scripts from untrusted external origins, blocks <object>/<embed>,
 locks down <base>, restricts where forms can post, and controls who may frame the
 site. frame-ancestors intentionally allows Telegram so the Mini App keeps working.
+
+ReplicaRoutingMiddleware decides, per request, whether reads may go to the
+read replica (see vaahakainn/routers.py).
+
+CompressionMiddleware compresses dynamic HTML/JSON responses (WhiteNoise only
+handles static files) with Brotli when the optional `brotli` package is
+installed and the client accepts it, gzip otherwise.
+
+ProfilingMiddleware profiles a single request on demand for staff users:
+add ?_profile=1 (or send "X-Profile: 1") to any page to get, instead of the
+page, a sampled call tree of the view and its template rendering plus every SQL
+query with its time and EXPLAIN plan; ?_profile=folded returns the samples as
+folded stacks for flamegraph.pl or speedscope.app. Other requests are not
+touched.
 """
 
+import hashlib
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.cache import add_never_cache_headers, patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_sequence, compress_string
+
+from vaahakainn.routers import use_primary
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
 # Sources the site genuinely uses:
 #   - Telegram Mini App SDK:        https://telegram.org
-#   - Google Fonts CSS:             https://fonts.googleapis.com
-#   - Google Fonts files:           https://fonts.gstatic.com
 #   - Cover images (Cloudinary) + inline data: SVGs
 #   - Embedding in the Telegram Web client (iframe): https://*.telegram.org
 CONTENT_SECURITY_POLICY = "; ".join([
@@ -23,8 +64,8 @@ CONTENT_SECURITY_POLICY = "; ".join([
     "base-uri 'self'",
     "object-src 'none'",
     "script-src 'self' 'unsafe-inline' https://telegram.org",
-    "style-src 'self' 'unsafe-inline' https://fonts.googleapis.com",
-    "font-src 'self' data: https://fonts.gstatic.com",
+    "style-src 'self' 'unsafe-inline'",
+    "font-src 'self' data:",
     "img-src 'self' data: https:",
     "connect-src 'self'",
     "form-action 'self'",
@@ -35,7 +76,7 @@ PERMISSIONS_POLICY = "camera=(), microphone=(), geolocation=(), interest-cohort=
 
 # Cross-origin isolation. We add the two SAFE ones and intentionally DO NOT set
 # Cross-Origin-Embedder-Policy (require-corp), which would block Cloudinary
-# images, Google Fonts and the Telegram SDK.
+# images and the Telegram SDK.
 #   COOP: only applies to top-level windows (ignored inside the Telegram iframe),
 #         "-allow-popups" keeps any popup flows working.
 #   CORP: "same-origin" is not enforced on the Telegram iframe because Telegram
@@ -43,6 +84,11 @@ PERMISSIONS_POLICY = "camera=(), microphone=(), geolocation=(), interest-cohort=
 CROSS_ORIGIN_OPENER_POLICY = "same-origin-allow-popups"
 CROSS_ORIGIN_RESOURCE_POLICY = "same-origin"
 
+# Cookie marking a client that wrote recently, so its reads stay on the primary
+# database until the replica has caught up (read-your-writes).
+REPLICA_PIN_COOKIE = "db_pin"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS", "TRACE")
+
 
 class SecurityHeadersMiddleware:
     def __init__(self, get_response):
@@ -56,3 +102,380 @@ class SecurityHeadersMiddleware:
         response.setdefault("Cross-Origin-Opener-Policy", CROSS_ORIGIN_OPENER_POLICY)
         response.setdefault("Cross-Origin-Resource-Policy", CROSS_ORIGIN_RESOURCE_POLICY)
         return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Pins a request's reads to the primary for writes, admin pages and clients
+    that wrote within the last REPLICA_PIN_SECONDS; everything else may read
+    from the replica. A no-op unless DATABASE_REPLICA_URL is configured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = bool(getattr(settings, "DATABASE_REPLICA_URL", ""))
+        self._admin_prefix = None
+
+    def _is_admin(self, request):
+        if self._admin_prefix is None:
+            self._admin_prefix = reverse("admin:index")
+        return request.path.startswith(self._admin_prefix)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        is_write = request.method not in SAFE_METHODS
+        pinned = is_write or REPLICA_PIN_COOKIE in request.COOKIES or self._is_admin(request)
+        with use_primary(pinned):
+            response = self.get_response(request)
+
+        if is_write and response.status_code < 400:
+            response.set_cookie(
+                REPLICA_PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+COMPRESSIBLE_TYPES = (
+    "text/html", "text/plain", "text/css", "text/xml", "text/javascript",
+    "application/json", "application/javascript", "application/xml", "image/svg+xml",
+)
+_accept_encoding_re = _lazy_re_compile(r"\s*([^\s;,]+)\s*(?:;\s*q=([0-9.]+))?")
+
+
+def accepted_encodings(header):
+    """Encodings named in an Accept-Encoding header, minus those with q=0."""
+    accepted = set()
+    for match in _accept_encoding_re.finditer(header or ""):
+        name, quality = match.group(1).lower(), match.group(2)
+        try:
+            if quality is None or float(quality) > 0:
+                accepted.add(name)
+        except ValueError:
+            continue
+    return accepted
+
+
+def _brotli_sequence(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Brotli/gzip for dynamic responses of at least COMPRESSION_MIN_SIZE bytes,
+    including streaming responses (compressed chunk by chunk).
+
+    Identical bodies of public responses (the same page rendered again) are
+    compressed once: the compressed bytes are kept in the 'compressed' cache
+    for COMPRESSION_CACHE_SECONDS, keyed by a hash of the body, so a hit costs
+    a hash instead of a compression. Responses that set cookies or are marked
+    Cache-Control: private/no-store are per-user and would only fill the
+    cache, so they are compressed without it. Vary: Cookie (every public read
+    view) is no reason to skip it: the key is the body itself.
+
+    File responses (WhiteNoise static files, /media/) are passed through:
+    static files already have precompressed .br/.gz variants, and wrapping a
+    file's iterator would stop the server from sending it with sendfile.
+
+    Admin pages embed CSRF tokens, so they always get gzip with Django's
+    random padding (BREACH mitigation, as in GZipMiddleware) and are never
+    cached; other per-user pages get the same padding when sent as gzip.
+    Public pages carry no secrets in their bodies.
+    """
+
+    max_random_bytes = 100
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, "COMPRESSION_MIN_SIZE", 860)
+        self.brotli_quality = getattr(settings, "COMPRESSION_BROTLI_QUALITY", 5)
+        self.cache_seconds = getattr(settings, "COMPRESSION_CACHE_SECONDS", 600)
+        self.max_cached_size = getattr(settings, "COMPRESSION_CACHE_MAX_SIZE", 512 * 1024)
+        self._admin_prefix = None
+
+    def _is_admin(self, request):
+        if self._admin_prefix is None:
+            self._admin_prefix = reverse("admin:index")
+        return request.path.startswith(self._admin_prefix)
+
+    @staticmethod
+    def _is_public(response):
+        cache_control = response.get("Cache-Control", "").lower()
+        return not (
+            response.cookies
+            or "private" in cache_control
+            or "no-store" in cache_control
+        )
+
+    def _encoding_for(self, request):
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding"))
+        if brotli is not None and "br" in accepted and not self._is_admin(request):
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _compress(self, content, encoding, cacheable):
+        if encoding == "gzip" and not cacheable:
+            return compress_string(content, max_random_bytes=self.max_random_bytes)
+
+        key = None
+        if cacheable and self.cache_seconds and len(content) <= self.max_cached_size:
+            key = f"{encoding}:{hashlib.blake2b(content, digest_size=16).hexdigest()}"
+            compressed = caches["compressed"].get(key)
+            if compressed is not None:
+                return compressed
+
+        if encoding == "br":
+            compressed = brotli.compress(content, quality=self.brotli_quality)
+        else:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            compressed = compressor.compress(content) + compressor.flush()
+        if key:
+            caches["compressed"].set(key, compressed, self.cache_seconds)
+        return compressed
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        content_type = response.get("Content-Type", "").split(";")[0].strip().lower()
+        if (
+            content_type not in COMPRESSIBLE_TYPES
+            or getattr(response, "file_to_stream", None) is not None
+            or response.has_header("Content-Encoding")
+            or response.status_code in (206, 304)
+            or (not response.streaming and len(response.content) < self.min_size)
+        ):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = self._encoding_for(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                # Async iterators only occur under ASGI; pass them through uncompressed.
+                return response
+            if encoding == "br":
+                response.streaming_content = _brotli_sequence(response.streaming_content, self.brotli_quality)
+            else:
+                response.streaming_content = compress_sequence(
+                    response.streaming_content, max_random_bytes=self.max_random_bytes,
+                )
+            del response.headers["Content-Length"]
+        else:
+            cacheable = not self._is_admin(request) and self._is_public(response)
+            compressed = self._compress(response.content, encoding, cacheable)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers["Content-Length"] = str(len(compressed))
+
+        # The compressed body differs from the uncompressed one, so a strong
+        # ETag must become weak (RFC 9110 8.8.3).
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+
+PROFILE_PARAM = "_profile"
+PROFILE_HEADER = "X-Profile"
+_profile_lock = threading.Lock()
+
+
+class _Sampler:
+    """Records the Python stack of one thread every `interval` seconds, from a helper thread."""
+
+    def __init__(self, thread_id, base_frame, interval):
+        self.thread_id = thread_id
+        self.base_frame = base_frame
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            # Stop at the middleware's own frame: what is above it is the same for every request.
+            while frame is not None and frame is not self.base_frame:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+class _QueryLog:
+    """execute_wrapper that records each query with its duration."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                "alias": context["connection"].alias,
+                "sql": sql,
+                "params": params,
+                "many": many,
+                "ms": (time.perf_counter() - started) * 1000,
+            })
+
+
+def _short_path(filename):
+    for prefix in sorted({str(settings.BASE_DIR), *sys.path}, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+def _frame_label(frame):
+    name, filename, line = frame
+    return f"{name} ({_short_path(filename)}:{line})"
+
+
+def _call_tree_rows(stacks, elapsed_ms, min_percent):
+    """Flatten the sampled stacks into (depth, label, samples, percent, ms) rows, depth first."""
+    total = sum(stacks.values())
+    root = {}
+    for stack, count in stacks.items():
+        children = root
+        for frame in stack:
+            node = children.setdefault(frame, [0, {}])
+            node[0] += count
+            children = node[1]
+
+    rows = []
+
+    def walk(children, depth):
+        for frame, (samples, grandchildren) in sorted(children.items(), key=lambda item: -item[1][0]):
+            percent = 100 * samples / total
+            if percent < min_percent:
+                continue
+            rows.append({
+                "depth": depth,
+                "label": _frame_label(frame),
+                "samples": samples,
+                "percent": percent,
+                "ms": elapsed_ms * samples / total,
+            })
+            walk(grandchildren, depth + 1)
+
+    if total:
+        walk(root, 0)
+    return rows
+
+
+def _explain(queries, limit):
+    """EXPLAIN plans for the `limit` slowest distinct SELECTs (without ANALYZE: nothing is re-run)."""
+    plans = {}
+    for query in sorted(queries, key=lambda query: -query["ms"]):
+        if len(plans) >= limit:
+            break
+        key = (query["alias"], query["sql"], repr(query["params"]))
+        if key in plans or query["many"] or not query["sql"].lstrip().upper().startswith("SELECT"):
+            continue
+        connection = connections[query["alias"]]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"{connection.ops.explain_query_prefix()} {query['sql']}", query["params"])
+                plans[key] = "\n".join(" ".join(str(column) for column in row) for row in cursor.fetchall())
+        except DatabaseError as exc:
+            plans[key] = f"EXPLAIN failed: {exc}"
+    for query in queries:
+        query["plan"] = plans.get((query["alias"], query["sql"], repr(query["params"])))
+    return queries
+
+
+class ProfilingMiddleware:
+    """
+    On-demand profile of one request for staff users (see the module
+    docstring). Must come after AuthenticationMiddleware. Only one request per
+    process is profiled at a time; a second one is served normally. Set
+    REQUEST_PROFILING = False to remove the middleware entirely.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REQUEST_PROFILING", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.interval = getattr(settings, "PROFILE_SAMPLE_INTERVAL", 0.001)
+        self.explain_limit = getattr(settings, "PROFILE_EXPLAIN_LIMIT", 20)
+        self.min_percent = getattr(settings, "PROFILE_MIN_PERCENT", 0.5)
+
+    def __call__(self, request):
+        mode = request.GET.get(PROFILE_PARAM) or request.headers.get(PROFILE_HEADER)
+        user = getattr(request, "user", None)
+        if not mode or not (user and user.is_staff) or not _profile_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self._profile(request, mode)
+        finally:
+            _profile_lock.release()
+
+    def _profile(self, request, mode):
+        query_log = _QueryLog()
+        sampler = _Sampler(threading.get_ident(), sys._getframe(), self.interval)
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+            with sampler:
+                response = self.get_response(request)
+                # Render lazily rendered and streamed bodies inside the profile too.
+                if hasattr(response, "render") and not response.is_rendered:
+                    response.render()
+                size = len(b"".join(response)) if response.streaming else len(response.content)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if mode == "folded":
+            body = "".join(
+                ";".join(_frame_label(frame) for frame in frames) + f" {count}\n"
+                for frames, count in sampler.stacks.most_common()
+            )
+            report = HttpResponse(body, content_type="text/plain; charset=utf-8")
+        else:
+            queries = _explain(query_log.queries, self.explain_limit)
+            folded = request.GET.copy()
+            folded[PROFILE_PARAM] = "folded"
+            report = HttpResponse(render_to_string("profile_report.html", {
+                "path": request.get_full_path(),
+                "folded_url": f"{request.path}?{folded.urlencode()}",
+                "status": response.status_code,
+                "size": size,
+                "elapsed_ms": elapsed_ms,
+                "samples": sum(sampler.stacks.values()),
+                "interval_ms": self.interval * 1000,
+                "rows": _call_tree_rows(sampler.stacks, elapsed_ms, self.min_percent),
+                "queries": queries,
+                "query_ms": sum(query["ms"] for query in queries),
+            }, request=request))
+        add_never_cache_headers(report)
+        return report
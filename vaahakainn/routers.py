@@ -0,0 +1,49 @@
+"""
+Primary/replica database routing.
+
+Reads go to the `replica` alias and writes to `default`. A request can be
+pinned to the primary (see ReplicaRoutingMiddleware): unsafe methods, admin
+pages and clients that wrote recently all read from `default`, so a reader who
+just posted a comment or reaction sees it even while the replica is lagging.
+Enabled only when DATABASE_REPLICA_URL is set.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+PRIMARY_ALIAS = 'default'
+REPLICA_ALIAS = 'replica'
+
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+
+def is_pinned_to_primary():
+    return _pinned_to_primary.get()
+
+
+@contextmanager
+def use_primary(pinned=True):
+    """Route every read in this block to the primary database."""
+    token = _pinned_to_primary.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _pinned_to_primary.get():
+            return PRIMARY_ALIAS
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data, so cross-alias relations are fine.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary via replication.
+        return db == PRIMARY_ALIAS
@@ -13,9 +13,6 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 import dj_database_url
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -84,13 +81,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'vaahakainn.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'vaahakainn.middleware.CompressionMiddleware',
     'vaahakainn.middleware.SecurityHeadersMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'vaahakainn.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'vaahakainn.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -118,12 +119,117 @@ WSGI_APPLICATION = 'vaahakainn.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Connections are persistent by default (DB_CONN_MAX_AGE seconds, with a health
+# check before reuse) so each request doesn't pay for a fresh Postgres handshake.
+# DB_POOL=True switches to Django's native psycopg 3 connection pool instead;
+# that requires the `psycopg[pool]` package and a postgresql DATABASE_URL.
 DATABASES = {
     'default': dj_database_url.config(
-        default=config('DATABASE_URL', default='sqlite:///db.sqlite3')
+        default=config('DATABASE_URL', default='sqlite:///db.sqlite3'),
+        conn_max_age=config('DB_CONN_MAX_AGE', default=600, cast=int),
+        conn_health_checks=config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
     )
 }
 
+if config('DB_POOL', default=False, cast=bool):
+    import importlib.util
+    from django.core.exceptions import ImproperlyConfigured
+
+    if 'postgresql' not in DATABASES['default']['ENGINE']:
+        raise ImproperlyConfigured('DB_POOL requires a PostgreSQL DATABASE_URL.')
+    if not (importlib.util.find_spec('psycopg') and importlib.util.find_spec('psycopg_pool')):
+        raise ImproperlyConfigured('DB_POOL requires psycopg 3 with the pool extra (pip install "psycopg[pool]").')
+    # The pool owns connection lifetime, so Django must not also keep them open.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+        'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+        'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+    }
+
+# Optional read replica. When DATABASE_REPLICA_URL is set, read-only traffic is
+# routed to it (vaahakainn/routers.py) and writes, admin pages and clients that
+# wrote in the last REPLICA_PIN_SECONDS stay on the primary.
+DATABASE_REPLICA_URL = config('DATABASE_REPLICA_URL', default='')
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=10, cast=int)
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        DATABASE_REPLICA_URL,
+        conn_max_age=DATABASES['default']['CONN_MAX_AGE'],
+        conn_health_checks=config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['vaahakainn.routers.PrimaryReplicaRouter']
+
+# Log connection reuse stats (see vaahakainn/dbstats.py) every N requests; 0 disables.
+DB_STATS_LOG_EVERY = config('DB_STATS_LOG_EVERY', default=1000, cast=int)
+
+
+# Caches
+# Local-memory by default (per process). Set REDIS_URL to share the cache —
+# and therefore rate limits and cache-backed sessions — across gunicorn workers
+# (uses the `redis` client from requirements.txt).
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+        'sessions': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'session',
+        },
+        'compressed': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'compressed',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'sessions': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'sessions',
+            # Bounded: once full, the oldest third of entries is culled instead
+            # of growing without limit like the django_session table did.
+            'OPTIONS': {'MAX_ENTRIES': config('SESSION_CACHE_MAX_ENTRIES', default=5000, cast=int)},
+        },
+        # Compressed response bodies (vaahakainn.middleware.CompressionMiddleware)
+        'compressed': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'compressed',
+            'OPTIONS': {'MAX_ENTRIES': config('COMPRESSION_CACHE_MAX_ENTRIES', default=200, cast=int)},
+        },
+    }
+
+
+# Sessions
+# Readers never log in (their language lives in its own signed cookie), so the
+# only real session user is the admin. Signed cookies keep session state on the
+# client, so no request does a django_session round trip. SESSION_BACKEND can
+# switch to 'cache' (needs REDIS_URL when running several workers), 'cached_db'
+# or the old 'db' backend. Run `manage.py purge_sessions` to clear leftover rows.
+SESSION_ENGINES = {
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'db': 'django.contrib.sessions.backends.db',
+}
+SESSION_BACKEND = config('SESSION_BACKEND', default='cookie')
+if SESSION_BACKEND not in SESSION_ENGINES:
+    from django.core.exceptions import ImproperlyConfigured
+
+    raise ImproperlyConfigured(
+        f'SESSION_BACKEND={SESSION_BACKEND!r} is not one of: {", ".join(SESSION_ENGINES)}.'
+    )
+SESSION_ENGINE = SESSION_ENGINES[SESSION_BACKEND]
+SESSION_CACHE_ALIAS = 'sessions'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -163,20 +269,42 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# Cloudinary Configuration
-cloudinary.config(
-    cloud_name=config('CLOUDINARY_CLOUD_NAME', default=''),
-    api_key=config('CLOUDINARY_API_KEY', default=''),
-    api_secret=config('CLOUDINARY_API_SECRET', default=''),
-    secure=True
-)
-
-# Media files - Using Cloudinary
-DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
-MEDIA_URL = '/media/'  # This will be overridden by Cloudinary URLs
-
-# WhiteNoise static file serving
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Cloudinary Configuration. Applied to the SDK in StoriesConfig.ready(), so
+# importing settings (e.g. gunicorn's master, manage.py check) doesn't load it.
+CLOUDINARY_CLOUD_NAME = config('CLOUDINARY_CLOUD_NAME', default='')
+CLOUDINARY_API_KEY = config('CLOUDINARY_API_KEY', default='')
+CLOUDINARY_API_SECRET = config('CLOUDINARY_API_SECRET', default='')
+
+# Media files. Covers and profile images are CloudinaryFields, which upload to
+# and are served from Cloudinary directly; the default storage (STORAGES below)
+# only holds leftover local files.
+MEDIA_URL = '/media/'
+# Leftover local files served under MEDIA_URL (vaahakainn/media.py). Without an
+# explicit root, /media/ resolved paths against the working directory.
+MEDIA_ROOT = config('MEDIA_ROOT', default=str(BASE_DIR / 'media'))
+# 'whitenoise' (serve from Django with range/ETag support), 'x-accel-redirect'
+# (nginx serves MEDIA_ACCEL_PREFIX + path from an internal location) or
+# 'x-sendfile' (Apache/lighttpd).
+MEDIA_SERVE_MODE = config('MEDIA_SERVE_MODE', default='whitenoise')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+MEDIA_CACHE_SECONDS = config('MEDIA_CACHE_SECONDS', default=60 * 60 * 24 * 365, cast=int)
+
+# Cover/profile image sizes and placeholders (stories/image_placeholders.py):
+# 'cloudinary', 'local' (Pillow), or empty to pick by CLOUDINARY_CLOUD_NAME.
+IMAGE_PIPELINE = config('IMAGE_PIPELINE', default='')
+# Derived widths Cloudinary generates eagerly for every new cover.
+COVER_EAGER_WIDTHS = (400, 800)
+
+# WhiteNoise static file serving. Hashed names from the manifest ({% static %})
+# are served with a one-year immutable Cache-Control. STATICFILES_STORAGE is
+# ignored since Django 5.1, so the storage has to be set through STORAGES.
+# The manifest is written by collectstatic, which runs in the build step
+# (nixpacks.toml; Heroku's Python buildpack runs it on its own); without it
+# every page fails with "Missing staticfiles manifest entry".
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -187,3 +315,66 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 TELEGRAM_BOT_TOKEN = config('TELEGRAM_BOT_TOKEN', default='')
 TELEGRAM_CHANNEL_ID = config('TELEGRAM_CHANNEL_ID', default='@Vaahakainn')
 SITE_URL = config('SITE_URL', default='https://vaahakainn.com')
+
+# Seconds a cached story table of contents may live (stories/toc.py). Saves
+# invalidate it immediately in the worker that made them; other workers pick up
+# the change when this expires unless REDIS_URL gives them a shared cache.
+STORY_TOC_CACHE_SECONDS = config('STORY_TOC_CACHE_SECONDS', default=600, cast=int)
+
+# Upper bound on home page snapshot staleness (stories/home_snapshot.py); content
+# changes also trigger an immediate background rebuild.
+HOME_SNAPSHOT_CACHE_SECONDS = config('HOME_SNAPSHOT_CACHE_SECONDS', default=300, cast=int)
+
+# Trending scores (stories/popularity.py) halve every this many hours; run
+# `manage.py update_popularity` hourly to apply the decay.
+POPULARITY_HALF_LIFE_HOURS = config('POPULARITY_HALF_LIFE_HOURS', default=72, cast=float)
+
+# Reactions older than this are compacted into daily rollups by
+# `manage.py rollup_reactions` (stories/reaction_rollups.py).
+REACTION_ROLLUP_AFTER_DAYS = config('REACTION_ROLLUP_AFTER_DAYS', default=30, cast=int)
+
+# Buffered view / read-completion counters (stories/view_counts.py): each worker
+# writes its counts at most every VIEW_FLUSH_SECONDS (sooner once it holds
+# VIEW_FLUSH_MAX_KEYS objects), and a visitor counts once per object per
+# VIEW_DEDUP_SECONDS.
+VIEW_FLUSH_SECONDS = config('VIEW_FLUSH_SECONDS', default=30, cast=int)
+VIEW_FLUSH_MAX_KEYS = config('VIEW_FLUSH_MAX_KEYS', default=5000, cast=int)
+VIEW_DEDUP_SECONDS = config('VIEW_DEDUP_SECONDS', default=1800, cast=int)
+
+# Response compression (vaahakainn.middleware.CompressionMiddleware). Brotli is
+# used when the `brotli` package is installed, gzip otherwise. Compressed bodies
+# of public responses are cached by content hash so re-rendering the same page
+# doesn't recompress; COMPRESSION_CACHE_SECONDS=0 disables that.
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=860, cast=int)
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=5, cast=int)
+COMPRESSION_CACHE_SECONDS = config('COMPRESSION_CACHE_SECONDS', default=600, cast=int)
+
+# /metrics (vaahakainn/metrics.py): staff users, or scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>". With several gunicorn workers set
+# METRICS_DIR to a writable directory so the endpoint can sum every worker.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=5, cast=int)
+
+# Staff-only ?_profile=1 request profiling (vaahakainn/middleware.py).
+REQUEST_PROFILING = config('REQUEST_PROFILING', default=True, cast=bool)
+PROFILE_SAMPLE_INTERVAL = config('PROFILE_SAMPLE_INTERVAL', default=0.001, cast=float)
+PROFILE_EXPLAIN_LIMIT = config('PROFILE_EXPLAIN_LIMIT', default=20, cast=int)
+
+# Send long pages (episode_detail) in chunks: head and chapter first, comments
+# after (stories/streaming.py). Off renders them as one ordinary response.
+STREAMING_RESPONSES = config('STREAMING_RESPONSES', default=True, cast=bool)
+
+# Logging
+# Send app loggers to stdout so Railway / gunicorn (--log-file -) pick them up.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'stream': 'ext://sys.stdout'},
+    },
+    'loggers': {
+        'stories': {'handlers': ['console'], 'level': config('LOG_LEVEL', default='INFO')},
+        'vaahakainn': {'handlers': ['console'], 'level': config('LOG_LEVEL', default='INFO')},
+    },
+}
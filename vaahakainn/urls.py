@@ -19,11 +19,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.views.static import serve
 from django.urls import re_path
 
+from vaahakainn.media import serve_media
+from vaahakainn.metrics import metrics_view
+
 urlpatterns = [
     path('rana.anya/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('', include('stories.urls')),
 ]
 
@@ -33,9 +36,8 @@ if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 else:
-    # Production (Railway) - serve media files manually
+    # Production (Railway) - leftover local media, with range/conditional
+    # requests and sendfile (or X-Accel-Redirect), see vaahakainn/media.py
     urlpatterns += [
-        re_path(r'^media/(?P<path>.*)$', serve, {
-            'document_root': settings.MEDIA_ROOT,
-        }),
+        re_path(r'^media/(?P<path>.*)$', serve_media),
     ]
@@ -0,0 +1,55 @@
+"""
+Work done once before serving, so the first request after a cold start does not
+pay for it.
+
+With gunicorn's preload_app (gunicorn.conf.py) warm_up() runs in the master
+before it forks, and every worker inherits the result: the URL resolver, the
+compiled templates (the cached template loader keeps them), and the ContentType
+cache. Without preload it runs once in each worker after it boots.
+
+It opens a database connection for the ContentType lookups; close_connections()
+must run before forking so no worker inherits (and later shares) that socket.
+"""
+
+import logging
+import time
+
+from django.core.cache import caches
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES = (
+    'home.html', 'story_list.html', 'story_detail.html', 'episode_list.html',
+    'episode_detail.html', 'short_story_list.html', 'short_story_detail.html',
+)
+
+
+def warm_up():
+    started = time.perf_counter()
+    get_resolver().url_patterns  # imports every urls/views module
+    get_resolver()._populate()
+
+    for name in TEMPLATES:
+        try:
+            get_template(name)
+        except TemplateDoesNotExist:
+            logger.warning('Warm-up: template %s not found', name)
+
+    try:
+        from django.contrib.contenttypes.models import ContentType
+        from stories.models import Comment, Episode, ShortStory, Story
+        ContentType.objects.get_for_models(Story, Episode, ShortStory, Comment)
+    except Exception:
+        # The database may not be reachable yet; requests will fill the cache.
+        logger.warning('Warm-up: could not load content types', exc_info=True)
+
+    logger.info('Warm-up finished in %.0f ms', (time.perf_counter() - started) * 1000)
+
+
+def close_connections():
+    connections.close_all()
+    caches.close_all()